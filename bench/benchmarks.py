@@ -0,0 +1,421 @@
+import argparse
+import asyncio
+import base64
+import glob
+import json
+import os
+import platform
+import select
+import signal
+import sys
+import time
+
+from bench.fake_server import FakeServer
+from client import Client
+from crypto import MessageCipher
+from kdf import KeyDerivation
+from loadgen import percentile
+from message import ChatMessage
+from protocol import FrameDecoder, RECV_SIZE, decode_message, encode_frame, encode_message
+from user import User
+
+# directory benchmark results are saved to, one JSON file per run
+RESULTS_DIR: str = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+
+# typical chat message used by the benchmarks
+SAMPLE_MESSAGE: str = "The quick brown fox jumps over the lazy dog, again and again."
+
+# pasted text used by the compression benchmark
+LONG_MESSAGE: str = (
+    "Traceback (most recent call last):\n"
+    '  File "client.py", line 212, in __receive_message\n'
+    "    frames = self.__recv_frames()\n"
+    '  File "client.py", line 190, in __recv_frames\n'
+    '    raise ConnectionResetError("Connection closed by the server")\n'
+    "ConnectionResetError: Connection closed by the server\n"
+    "I think this happens because the server restarted while we were still sending messages, "
+    "does anyone know whether the client should reconnect automatically or do we have to restart it?"
+)
+
+# root directory of the client, the startup benchmark starts the client from it
+CLIENT_DIR: str = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# text of the login form's first frame the startup benchmark waits for
+LOGIN_FORM_MARKER: bytes = b"Username"
+
+# client startup commands measured by the startup benchmark, {port} gets replaced by the fake server's port
+STARTUP_COMMANDS: dict = {
+    "threaded": "from client import Client; from user import User; Client(User()).start('127.0.0.1', {port})",
+    "asyncio": (
+        "import asyncio; from client import Client; from user import User; "
+        "asyncio.run(Client(User()).start_async('127.0.0.1', {port}))"
+    ),
+}
+
+# relative change of a result which gets reported as regression or improvement
+SIGNIFICANT_CHANGE: float = 0.10
+
+
+def bench_encrypt(count: int) -> dict:
+    """
+    Measures the batch encryption throughput.
+
+    :param count: number of messages to encrypt
+    :return: dict with the results
+    """
+    cipher = MessageCipher(base64.urlsafe_b64encode(b"b" * 32))
+    messages = [SAMPLE_MESSAGE] * count
+
+    start = time.perf_counter()
+    cipher.encrypt_messages(messages)
+    elapsed = time.perf_counter() - start
+
+    return {"messages_per_second": count / elapsed}
+
+
+def bench_decrypt(count: int) -> dict:
+    """
+    Measures the batch decryption throughput, for messages of the own key and messages of a foreign key.
+
+    :param count: number of messages to decrypt
+    :return: dict with the results
+    """
+    cipher = MessageCipher(base64.urlsafe_b64encode(b"b" * 32))
+    foreign_cipher = MessageCipher(base64.urlsafe_b64encode(b"f" * 32))
+    own_messages = cipher.encrypt_messages([SAMPLE_MESSAGE] * count)
+    foreign_messages = foreign_cipher.encrypt_messages([SAMPLE_MESSAGE] * count)
+
+    start = time.perf_counter()
+    cipher.decrypt_messages(own_messages)
+    own_elapsed = time.perf_counter() - start
+
+    start = time.perf_counter()
+    cipher.decrypt_messages(foreign_messages)
+    foreign_elapsed = time.perf_counter() - start
+
+    return {"messages_per_second": count / own_elapsed, "foreign_messages_per_second": count / foreign_elapsed}
+
+
+def bench_frame_decoding(count: int) -> dict:
+    """
+    Measures how fast received bytes are split into frames, fed in recv sized chunks.
+
+    :param count: number of frames to decode
+    :return: dict with the results
+    """
+    payload = json.dumps({"username": "bench", "message": SAMPLE_MESSAGE * 2}).encode("utf-8")
+    stream = encode_frame(payload) * count
+    chunks = [stream[i:i + RECV_SIZE] for i in range(0, len(stream), RECV_SIZE)]
+    decoder = FrameDecoder()
+
+    start = time.perf_counter()
+    decoded = 0
+    for chunk in chunks:
+        decoded += len(decoder.feed(chunk))
+    elapsed = time.perf_counter() - start
+
+    assert decoded == count
+    return {"frames_per_second": count / elapsed, "megabytes_per_second": len(stream) / elapsed / 1e6}
+
+
+def bench_wire_formats(count: int) -> dict:
+    """
+    Compares the JSON and the binary wire format by the size of a received message frame and the throughput of
+    parsing and decrypting received frames.
+
+    :param count: number of frames to process per format
+    :return: dict with the results
+    """
+    cipher = MessageCipher(base64.urlsafe_b64encode(b"b" * 32))
+    key_id = cipher.get_raw_key_id()
+    json_frames = [
+        json.dumps({"username": "bench", "message": token.decode()}).encode("utf-8")
+        for token in cipher.encrypt_messages([SAMPLE_MESSAGE] * count)
+    ]
+    binary_frames = [
+        encode_message(key_id, token, b"bench")[4:]
+        for _, token in cipher.encrypt_raw_messages([SAMPLE_MESSAGE] * count)
+    ]
+
+    start = time.perf_counter()
+    received_data = [json.loads(frame) for frame in json_frames]
+    cipher.decrypt_messages([data["message"].encode() for data in received_data])
+    json_elapsed = time.perf_counter() - start
+
+    start = time.perf_counter()
+    received_data = [decode_message(frame) for frame in binary_frames]
+    cipher.decrypt_raw_messages([(key_id, ciphertext, False) for _, key_id, _, _, ciphertext in received_data])
+    binary_elapsed = time.perf_counter() - start
+
+    return {
+        "json_frame_bytes": len(json_frames[0]) + 4,
+        "binary_frame_bytes": len(binary_frames[0]) + 4,
+        "json_messages_per_second": count / json_elapsed,
+        "binary_messages_per_second": count / binary_elapsed,
+    }
+
+
+def bench_compression(count: int) -> dict:
+    """
+    Measures the size of an encrypted pasted text with and without compressing it first, and the throughput of
+    encrypting and decrypting it compressed.
+
+    :param count: number of messages to encrypt and decrypt
+    :return: dict with the results
+    """
+    key = base64.urlsafe_b64encode(b"b" * 32)
+    cipher = MessageCipher(key, compression_threshold=256)
+
+    start = time.perf_counter()
+    encrypted_messages = cipher.encrypt_raw_messages([LONG_MESSAGE] * count)
+    encrypt_elapsed = time.perf_counter() - start
+
+    key_id = cipher.get_raw_key_id()
+    start = time.perf_counter()
+    cipher.decrypt_raw_messages([(key_id, token, compressed) for compressed, token in encrypted_messages])
+    decrypt_elapsed = time.perf_counter() - start
+
+    return {
+        "uncompressed_token_bytes": len(MessageCipher(key).encrypt_raw(LONG_MESSAGE)[1]),
+        "compressed_token_bytes": len(encrypted_messages[0][1]),
+        "encrypt_messages_per_second": count / encrypt_elapsed,
+        "decrypt_messages_per_second": count / decrypt_elapsed,
+    }
+
+
+def bench_key_derivation(count: int) -> dict:
+    """
+    Measures deriving an encryption key with the default parameters, and getting it from the in-memory cache.
+
+    :param count: number of cached lookups
+    :return: dict with the results
+    """
+    key_derivation = KeyDerivation()
+
+    start = time.perf_counter()
+    key_derivation.derive("bench passphrase")
+    derive_elapsed = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for _ in range(count):
+        key_derivation.derive("bench passphrase")
+    cached_elapsed = time.perf_counter() - start
+
+    return {
+        "derive_ms": derive_elapsed * 1000,
+        "microseconds_per_cached_lookup": cached_elapsed / count * 1e6,
+    }
+
+
+def bench_round_trip(count: int) -> dict:
+    """
+    Measures the latency from sending a message to receiving it on another client through the fake server.
+
+    :param count: number of messages to send one after another
+    :return: dict with the results
+    """
+    server = FakeServer()
+    port = server.start()
+    sender = Client(User())
+    receiver = Client(User())
+
+    try:
+        for name, client in (("bench-tx", sender), ("bench-rx", receiver)):
+            client.connect("127.0.0.1", port)
+            client.login(name, "bench", "bench", register=True)
+            client.start_messaging()
+
+        latencies = []
+        for _ in range(count):
+            start = time.perf_counter()
+            sender.send(SAMPLE_MESSAGE)
+            receiver.receive(timeout=5)
+            latencies.append(time.perf_counter() - start)
+    finally:
+        sender.close()
+        receiver.close()
+        server.stop()
+
+    latencies.sort()
+    return {
+        "latency_p50_ms": percentile(latencies, 0.50) * 1000,
+        "latency_p99_ms": percentile(latencies, 0.99) * 1000,
+    }
+
+
+def bench_render(count: int) -> dict:
+    """
+    Measures the cost of writing received messages to the chat UI's log, using Textual's headless test mode.
+
+    :param count: number of messages to render
+    :return: dict with the results
+    """
+    from tui.channel_log import ChannelLog
+    from tui.chat_ui import ChatTUI
+
+    async def render() -> float:
+        user = User(rx_buffer_size=count)
+        chat_ui = ChatTUI(user=user)
+        async with chat_ui.run_test() as pilot:
+            channel_log = chat_ui.query_one(ChannelLog)
+            start = time.perf_counter()
+            for _ in range(count):
+                user.add_to_rx_message_buffer(ChatMessage("bench", SAMPLE_MESSAGE))
+            while len(channel_log.get_messages()) < count:
+                await pilot.pause()
+            return time.perf_counter() - start
+
+    elapsed = asyncio.run(render())
+    return {"microseconds_per_message": elapsed / count * 1e6}
+
+
+def measure_startup(command: str, timeout: float = 30.0) -> float:
+    """
+    Starts the client in a pseudo terminal and measures the time until the login form's first frame is drawn.
+
+    :param command: Python code starting the client
+    :param timeout: maximum time in seconds to wait for the first frame
+    :return: time to the first interactive frame in seconds
+    """
+    import pty
+
+    start = time.perf_counter()
+    pid, fd = pty.fork()
+    if pid == 0:
+        os.chdir(CLIENT_DIR)
+        os.environ.setdefault("TERM", "xterm-256color")
+        os.execv(sys.executable, [sys.executable, "-c", command])
+
+    output = b""
+    try:
+        while LOGIN_FORM_MARKER not in output:
+            readable, _, _ = select.select([fd], [], [], timeout)
+            if not readable:
+                raise TimeoutError(f"Login form hasn't been drawn within {timeout} seconds")
+            output += os.read(fd, RECV_SIZE)
+        return time.perf_counter() - start
+    finally:
+        os.kill(pid, signal.SIGKILL)
+        os.waitpid(pid, 0)
+        os.close(fd)
+
+
+def bench_startup(runs: int) -> dict:
+    """
+    Measures the time from starting the client process to the first interactive frame of the login form,
+    connecting to the fake server. Only supported on platforms with pseudo terminals.
+
+    :param runs: number of client starts per mode, the median is reported
+    :return: dict with the results
+    """
+    if not hasattr(os, "fork"):
+        return {}
+
+    server = FakeServer()
+    port = server.start()
+    try:
+        results = {}
+        for mode, command in STARTUP_COMMANDS.items():
+            durations = sorted(measure_startup(command.format(port=port)) for _ in range(runs))
+            results[f"{mode}_ms"] = percentile(durations, 0.5) * 1000
+        return results
+    finally:
+        server.stop()
+
+
+def run_benchmarks(quick: bool = False) -> dict:
+    """
+    Runs every benchmark.
+
+    :param quick: run fewer iterations, e.g. to check the benchmarks themselves
+    :return: dict with the results of every benchmark
+    """
+    scale = 10 if quick else 1
+    return {
+        "encrypt": bench_encrypt(20000 // scale),
+        "decrypt": bench_decrypt(20000 // scale),
+        "frame_decoding": bench_frame_decoding(200000 // scale),
+        "wire_formats": bench_wire_formats(20000 // scale),
+        "compression": bench_compression(20000 // scale),
+        "key_derivation": bench_key_derivation(20000 // scale),
+        "round_trip": bench_round_trip(2000 // scale),
+        "render": bench_render(20000 // scale),
+        "startup": bench_startup(10 // scale + 1),
+    }
+
+
+def save_results(results: dict) -> str:
+    """
+    Saves benchmark results to the results directory.
+
+    :param results: results of run_benchmarks
+    :return: path of the results file
+    """
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    timestamp = time.strftime("%Y%m%d-%H%M%S")
+    path = os.path.join(RESULTS_DIR, f"{timestamp}.json")
+    with open(path, "w") as file:
+        json.dump({"timestamp": timestamp, "python": platform.python_version(), "results": results}, file, indent=2)
+    return path
+
+
+def load_latest_results() -> dict or None:
+    """
+    Loads the results of the most recent saved run.
+
+    :return: results of the run or None if no results have been saved yet
+    """
+    paths = sorted(glob.glob(os.path.join(RESULTS_DIR, "*.json")))
+    if not paths:
+        return None
+    with open(paths[-1]) as file:
+        return json.load(file)["results"]
+
+
+def print_results(results: dict, previous: dict or None) -> None:
+    """
+    Prints benchmark results and their change compared to previous results.
+    Metrics ending in "_ms" or "_bytes" or starting with "microseconds" are better when lower, every other metric when
+    higher.
+
+    :param results: results of run_benchmarks
+    :param previous: previous results to compare with or None
+    """
+    for benchmark, metrics in results.items():
+        for metric, value in metrics.items():
+            line = f"{benchmark + '.' + metric:<45} {value:>14.3f}"
+
+            previous_value = (previous or {}).get(benchmark, {}).get(metric)
+            if previous_value:
+                change = (value - previous_value) / previous_value
+                lower_is_better = metric.endswith(("_ms", "_bytes")) or metric.startswith("microseconds")
+                regressed = change > SIGNIFICANT_CHANGE if lower_is_better else change < -SIGNIFICANT_CHANGE
+                improved = change < -SIGNIFICANT_CHANGE if lower_is_better else change > SIGNIFICANT_CHANGE
+                line += f" {change:>+8.1%}"
+                if regressed:
+                    line += "  REGRESSION"
+                elif improved:
+                    line += "  improvement"
+
+            print(line)
+
+
+def main() -> None:
+    """
+    Runs the benchmarks, prints them compared to the previous run and saves them.
+    """
+    parser = argparse.ArgumentParser(description="Run the PyTalk client benchmarks.")
+    parser.add_argument("--quick", action="store_true", help="run fewer iterations")
+    parser.add_argument("--no-save", action="store_true", help="don't save the results")
+    args = parser.parse_args()
+
+    previous = load_latest_results()
+    results = run_benchmarks(quick=args.quick)
+    print_results(results, previous)
+
+    if not args.no_save:
+        print(f"Results saved to {save_results(results)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,299 @@
+import argparse
+import asyncio
+import base64
+import binascii
+import collections
+import itertools
+import json
+import threading
+
+from crypto import COMPRESSED_SEPARATOR, KEY_ID_SEPARATOR, UNTAGGED_KEY_ID
+from protocol import (
+    FLAG_COMPRESSED,
+    FORMAT_BINARY,
+    FORMAT_JSON,
+    FrameDecoder,
+    FrameError,
+    HEARTBEAT_TYPE,
+    RECV_SIZE,
+    SUPPORTED_FORMATS,
+    SYNC_REQUEST_TYPE,
+    decode_message,
+    decode_sync_request,
+    encode_frame,
+    encode_message,
+    encode_sync_end,
+)
+
+# number of relayed messages kept for clients catching up on missed messages, older ones are dropped
+MESSAGE_LOG_SIZE: int = 100_000
+
+
+class FakeServer:
+    """
+    Loopback stand-in for PyTalk_Server speaking the client's login, register and broadcast protocol.
+
+    Accounts are only kept in memory. Every message of an authenticated client is broadcast to every other
+    authenticated client as {"username", "message"}, or as binary message frame to clients which negotiated the
+    binary wire format when authenticating. Messages are converted between both formats as needed, heartbeats of
+    the binary format are echoed back.
+
+    Relayed messages are numbered and the newest of them are kept, so clients of the binary format can ask for the
+    messages of a key they have missed since a sequence number and get them in pages.
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0) -> None:
+        """
+        Initialize the server.
+
+        :param host: IP address to listen on
+        :param port: port to listen on, 0 picks a free port
+        """
+        self.__host = host
+        self.__port = port
+        self.__accounts: dict = {}
+        self.__writers: dict = {}
+        self.__sequence: int = 0
+        self.__messages: collections.deque = collections.deque(maxlen=MESSAGE_LOG_SIZE)
+        self.__live_from: dict = {}
+        self.__connections: set = set()
+        self.__server: asyncio.Server or None = None
+        self.__loop: asyncio.AbstractEventLoop or None = None
+        self.__thread: threading.Thread or None = None
+
+    def get_port(self) -> int:
+        """Get the port the server listens on."""
+        return self.__port
+
+    def __authenticate(self, request: dict) -> bool:
+        """
+        Handles a login or register request.
+
+        :param request: decoded authentication request
+        :return: True if the user has been authenticated, False if not
+        """
+        username = request.get("username")
+        pw_hash = request.get("pw_hash")
+
+        if request.get("operation") == "register":
+            if username in self.__accounts:
+                return False
+            self.__accounts[username] = pw_hash
+            return True
+
+        return self.__accounts.get(username) == pw_hash
+
+    @staticmethod
+    def __choose_format(request: dict) -> str:
+        """
+        Chooses the wire format of a connection from the formats offered in an authentication request.
+
+        :param request: decoded authentication request
+        :return: most preferred format supported by both sides, JSON for clients which don't offer any
+        """
+        offered = request.get("formats") or []
+        return next((wire_format for wire_format in SUPPORTED_FORMATS if wire_format in offered), FORMAT_JSON)
+
+    @staticmethod
+    def __to_json_frame(username: str, key_id: bytes, flags: int, token: bytes) -> bytes:
+        """Builds a JSON message frame from the fields of a binary message."""
+        message = base64.urlsafe_b64encode(token)
+        if key_id != UNTAGGED_KEY_ID:
+            separator = COMPRESSED_SEPARATOR if flags & FLAG_COMPRESSED else KEY_ID_SEPARATOR
+            message = base64.urlsafe_b64encode(key_id) + separator + message
+        return encode_frame(json.dumps({"username": username, "message": message.decode()}).encode("utf-8"))
+
+    @staticmethod
+    def __parse_json_message(message: bytes) -> tuple:
+        """Gets the raw key id, flags and raw token of a message sent in JSON mode, i.e. a tagged base64 Fernet token."""
+        key_id, flags, token = UNTAGGED_KEY_ID, 0, message
+        for separator, separator_flags in ((KEY_ID_SEPARATOR, 0), (COMPRESSED_SEPARATOR, FLAG_COMPRESSED)):
+            if separator in message:
+                encoded_key_id, _, token = message.partition(separator)
+                key_id, flags = base64.urlsafe_b64decode(encoded_key_id), separator_flags
+        return key_id, flags, base64.urlsafe_b64decode(token)
+
+    def __broadcast(self, sender: asyncio.StreamWriter, username: str, message: bytes) -> None:
+        """
+        Numbers a message, keeps it for syncing clients and sends it to every authenticated client except the sender,
+        in each client's wire format.
+
+        :param sender: stream writer of the sending client
+        :param username: name of the sending user
+        :param message: message frame as sent by the client
+        """
+        # build the frame of each format once, starting with the format the message has been sent in
+        frames = {}
+        try:
+            if self.__writers[sender] == FORMAT_BINARY:
+                _, key_id, flags, _, token = decode_message(message)
+                token = bytes(token)
+                frames[FORMAT_JSON] = self.__to_json_frame(username, key_id, flags, token)
+            else:
+                frames[FORMAT_JSON] = encode_frame(
+                    json.dumps({"username": username, "message": message.decode()}).encode("utf-8")
+                )
+                key_id, flags, token = self.__parse_json_message(message)
+
+            self.__sequence += 1
+            self.__messages.append((self.__sequence, username, key_id, flags, token))
+            frames[FORMAT_BINARY] = encode_message(key_id, token, username.encode("utf-8"), flags, self.__sequence)
+        except (FrameError, ValueError, binascii.Error):
+            # messages which can't be converted are only relayed in the formats built so far
+            pass
+
+        for writer, wire_format in self.__writers.items():
+            if writer is not sender and wire_format in frames:
+                writer.write(frames[wire_format])
+
+    def __sync(self, writer: asyncio.StreamWriter, username: str, frame: bytes) -> None:
+        """
+        Answers a sync request with a page of the kept messages of a key, followed by a sync end. Messages relayed
+        since the client authenticated have been sent to it live and its own messages are left out.
+
+        :param writer: stream writer of the requesting client
+        :param username: name of the requesting user
+        :param frame: payload of the sync request frame
+        """
+        key_id, after, limit = decode_sync_request(frame)
+        live_from = self.__live_from[writer]
+
+        # sequence numbers are consecutive, so the first kept message after the requested one is found by its offset
+        end = live_from
+        if limit and self.__messages:
+            start = max(after + 1 - self.__messages[0][0], 0)
+            sent = 0
+            for sequence, sender, message_key_id, flags, token in itertools.islice(self.__messages, start, None):
+                if sequence > live_from:
+                    break
+                if message_key_id != key_id or sender == username:
+                    continue
+                writer.write(encode_message(key_id, token, sender.encode("utf-8"), flags, sequence))
+                sent += 1
+                if sent == limit:
+                    end = sequence
+                    break
+
+        writer.write(encode_sync_end(key_id, end, end < live_from))
+
+    async def __handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """
+        Serves a single client connection until it's closed.
+        """
+        decoder = FrameDecoder()
+        username = None
+        self.__connections.add(writer)
+
+        try:
+            while data := await reader.read(RECV_SIZE):
+                for frame in decoder.feed(data):
+                    if username is not None:
+                        frame_type = frame[0] if self.__writers[writer] == FORMAT_BINARY and frame else None
+
+                        # heartbeats of the binary format are echoed back to their sender
+                        if frame_type == HEARTBEAT_TYPE:
+                            writer.write(encode_frame(frame))
+                        elif frame_type == SYNC_REQUEST_TYPE:
+                            try:
+                                self.__sync(writer, username, frame)
+                            except FrameError:
+                                pass
+                        else:
+                            self.__broadcast(writer, username, frame)
+                        continue
+
+                    try:
+                        request = json.loads(frame)
+                    except ValueError:
+                        request = {}
+                    if self.__authenticate(request):
+                        username = request["username"]
+                        wire_format = self.__choose_format(request)
+                        self.__writers[writer] = wire_format
+                        self.__live_from[writer] = self.__sequence
+
+                        # only clients which offered formats know about the negotiation
+                        feedback = f"OK {wire_format}" if request.get("formats") else "OK"
+                        writer.write(encode_frame(feedback.encode("utf-8")))
+                    else:
+                        writer.write(encode_frame(b"NOT OK"))
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            self.__writers.pop(writer, None)
+            self.__live_from.pop(writer, None)
+            self.__connections.discard(writer)
+            writer.close()
+
+    async def serve(self, started: threading.Event or None = None) -> None:
+        """
+        Serves clients in the running event loop until the task is cancelled.
+
+        :param started: optional event which gets set as soon as the server is listening
+        """
+        self.__server = await asyncio.start_server(self.__handle_client, self.__host, self.__port)
+        self.__port = self.__server.sockets[0].getsockname()[1]
+        if started is not None:
+            started.set()
+
+        async with self.__server:
+            await self.__server.serve_forever()
+
+    def start(self) -> int:
+        """
+        Starts serving clients in a background thread with its own event loop.
+
+        :return: port the server listens on
+        """
+        started = threading.Event()
+        self.__loop = asyncio.new_event_loop()
+
+        def run() -> None:
+            loop = self.__loop
+            asyncio.set_event_loop(loop)
+            try:
+                loop.run_until_complete(self.serve(started))
+            except asyncio.CancelledError:
+                pass
+            finally:
+                # let the connection handlers finish before closing the loop
+                loop.run_until_complete(asyncio.gather(*asyncio.all_tasks(loop), return_exceptions=True))
+                loop.close()
+
+        self.__thread = threading.Thread(target=run, daemon=True)
+        self.__thread.start()
+        started.wait()
+        return self.__port
+
+    def stop(self) -> None:
+        """
+        Stops the server started with start.
+        """
+        def shutdown() -> None:
+            # closing the server ends serve_forever, closing the connections ends their handlers
+            self.__server.close()
+            for writer in self.__connections:
+                writer.close()
+
+        self.__loop.call_soon_threadsafe(shutdown)
+        self.__thread.join()
+
+
+def main() -> None:
+    """
+    Runs the fake server in the foreground.
+    """
+    parser = argparse.ArgumentParser(description="Run a loopback stand-in PyTalk server.")
+    parser.add_argument("--host", default="127.0.0.1", help="IP address to listen on")
+    parser.add_argument("--port", type=int, default=55555, help="port to listen on")
+    args = parser.parse_args()
+
+    try:
+        asyncio.run(FakeServer(args.host, args.port).serve())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
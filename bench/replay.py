@@ -0,0 +1,270 @@
+import argparse
+import asyncio
+import cProfile
+import pstats
+import threading
+import time
+import tracemalloc
+
+from client import Client
+from protocol import FrameDecoder, RECV_SIZE, encode_frame
+from session_trace import read_trace
+from user import User
+
+# number of functions and allocation sites shown when profiling
+PROFILE_TOP: int = 25
+
+# size of the terminal the chat UI renders to while replaying
+UI_SIZE: tuple = (120, 40)
+
+
+class TraceServer:
+    """
+    Loopback server replaying a recorded trace to a single client.
+
+    Any login is accepted and answered with the wire format the trace has been recorded in, then the recorded bursts
+    are sent, either at the pace they have been received at or as fast as possible. Frames sent by the client, e.g.
+    sync requests or heartbeats, are ignored.
+    """
+
+    def __init__(self, bursts: list, wire_format: str, max_speed: bool = False) -> None:
+        """
+        Initialize the server.
+
+        :param bursts: list of (nanoseconds since the recording started, list of frame payloads) tuples
+        :param wire_format: wire format the frames have been recorded in
+        :param max_speed: send the bursts back to back instead of at their original pace
+        """
+        self.__bursts = bursts
+        self.__wire_format = wire_format
+        self.__max_speed = max_speed
+        self.__finished = threading.Event()
+        self.__connections: set = set()
+        self.__server: asyncio.Server or None = None
+        self.__loop: asyncio.AbstractEventLoop or None = None
+        self.__thread: threading.Thread or None = None
+
+    def get_feedback_frame(self) -> bytes:
+        """Get the framed answer to the client's authentication request."""
+        return encode_frame(f"OK {self.__wire_format}".encode("utf-8"))
+
+    def get_finished(self) -> bool:
+        """Get whether every burst has been sent."""
+        return self.__finished.is_set()
+
+    async def __handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """
+        Accepts the client's authentication request and sends it the recorded bursts.
+        """
+        self.__connections.add(writer)
+        try:
+            # wait for the authentication request
+            decoder = FrameDecoder()
+            while not decoder.feed(await reader.read(RECV_SIZE)):
+                if reader.at_eof():
+                    return
+            writer.write(self.get_feedback_frame())
+
+            # send every burst with a single write, at the pace it has been received at unless replaying at max speed
+            start = time.monotonic_ns()
+            first_timestamp = self.__bursts[0][0] if self.__bursts else 0
+            for timestamp, frames in self.__bursts:
+                if not self.__max_speed:
+                    delay = (start + timestamp - first_timestamp - time.monotonic_ns()) / 1e9
+                    if delay > 0:
+                        await asyncio.sleep(delay)
+                writer.writelines([encode_frame(frame) for frame in frames])
+                await writer.drain()
+            self.__finished.set()
+
+            # keep the connection open until the client closes it, the client would reconnect otherwise
+            while await reader.read(RECV_SIZE):
+                pass
+        except ConnectionError:
+            pass
+        finally:
+            self.__connections.discard(writer)
+            writer.close()
+
+    def start(self) -> int:
+        """
+        Starts serving in a background thread with its own event loop, so the server doesn't show up when profiling
+        the client's event loop.
+
+        :return: port the server listens on
+        """
+        started = threading.Event()
+        self.__loop = asyncio.new_event_loop()
+
+        async def serve() -> None:
+            self.__server = await asyncio.start_server(self.__handle_client, "127.0.0.1", 0)
+            started.set()
+            async with self.__server:
+                await self.__server.serve_forever()
+
+        def run() -> None:
+            loop = self.__loop
+            asyncio.set_event_loop(loop)
+            try:
+                loop.run_until_complete(serve())
+            except asyncio.CancelledError:
+                pass
+            finally:
+                # let the connection handlers finish before closing the loop
+                loop.run_until_complete(asyncio.gather(*asyncio.all_tasks(loop), return_exceptions=True))
+                loop.close()
+
+        self.__thread = threading.Thread(target=run, daemon=True)
+        self.__thread.start()
+        started.wait()
+        return self.__server.sockets[0].getsockname()[1]
+
+    def stop(self) -> None:
+        """
+        Stops the server started with start.
+        """
+        def shutdown() -> None:
+            self.__server.close()
+            for writer in self.__connections:
+                writer.close()
+
+        self.__loop.call_soon_threadsafe(shutdown)
+        self.__thread.join()
+
+
+async def replay(
+    trace_path: str,
+    encr_key: str,
+    channels: list,
+    max_speed: bool = False,
+    crypto_workers: int = 0,
+    profile_path: str or None = None,
+    trace_allocations: bool = False,
+) -> dict:
+    """
+    Replays a trace through the client's receive path and the chat UI, running headless: the frames are received
+    from a loopback server, decoded, decrypted, buffered and written to the channels' logs.
+
+    :param trace_path: path of a trace recorded with the client's trace_path
+    :param encr_key: passphrase of the main channel the trace has been recorded with
+    :param channels: list of (name, passphrase) tuples of further channels to join
+    :param max_speed: replay as fast as possible instead of at the original pace
+    :param crypto_workers: number of threads decrypting large bursts, 0 decrypts in the event loop
+    :param profile_path: file the cProfile stats of the event loop get written to, None disables profiling
+    :param trace_allocations: show the allocation sites of the replay's memory using tracemalloc
+    :return: dict with the results
+    """
+    from tui.chat_ui import ChatTUI
+
+    trace = list(read_trace(trace_path))
+    if not trace:
+        raise ValueError(f"{trace_path} doesn't contain any frames")
+    bursts = [(timestamp, frames) for timestamp, _, frames in trace]
+    frame_count = sum(len(frames) for _, frames in bursts)
+
+    # a trace spanning several connections is replayed over a single one
+    wire_formats = {wire_format for _, wire_format, _ in trace}
+    if len(wire_formats) > 1:
+        print(f"Trace mixes the wire formats {sorted(wire_formats)}, replaying every frame in the first one")
+
+    server = TraceServer(bursts, trace[0][1], max_speed)
+    port = server.start()
+
+    # every replayed message has to reach the log, so the rx buffers don't drop any
+    user = User(rx_buffer_size=max(frame_count, 1))
+    client = Client(user, crypto_workers=crypto_workers, heartbeat_interval=None)
+    await client.connect_async("127.0.0.1", port)
+    await client.login_async("replay", "replay", encr_key)
+    for name, passphrase in channels:
+        user.add_channel(name, passphrase)
+
+    # the replay is complete once every frame has been processed, possibly by the decryption worker, and every
+    # message has been written to a log
+    chat_ui = ChatTUI(user=user)
+
+    async def exit_when_replayed() -> None:
+        stats = user.get_stats()
+        while not (
+            server.get_finished()
+            and stats.get_counter("frames_processed") >= frame_count
+            and not any(len(channel.get_rx_message_buffer()) for channel in user.get_channels())
+        ):
+            await asyncio.sleep(0.01)
+        chat_ui.exit()
+
+    profiler = cProfile.Profile() if profile_path is not None else None
+    if trace_allocations:
+        tracemalloc.start()
+    if profiler is not None:
+        profiler.enable()
+
+    start = time.perf_counter()
+    client.start_messaging_async()
+    exit_task = asyncio.create_task(exit_when_replayed())
+    await chat_ui.run_async(headless=True, size=UI_SIZE)
+    elapsed = time.perf_counter() - start
+
+    if profiler is not None:
+        profiler.disable()
+        profiler.dump_stats(profile_path)
+        pstats.Stats(profiler).sort_stats("cumulative").print_stats(PROFILE_TOP)
+    if trace_allocations:
+        snapshot = tracemalloc.take_snapshot()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        print(f"peak traced memory: {peak / 1024 / 1024:.1f} MiB")
+        for statistic in snapshot.statistics("lineno")[:PROFILE_TOP]:
+            print(statistic)
+
+    exit_task.cancel()
+    await client.close_async()
+    server.stop()
+
+    snapshot = user.get_stats().snapshot()
+    counters = snapshot["counters"]
+    return {
+        "bursts": len(bursts),
+        "frames": frame_count,
+        "messages_received": counters.get("messages_received", 0),
+        "messages_undecryptable": counters.get("messages_undecryptable", 0),
+        "elapsed_s": elapsed,
+        "frames_per_second": frame_count / elapsed,
+        "stages": snapshot["stages"],
+    }
+
+
+def main() -> None:
+    """
+    Replays a trace from the command line and prints the results.
+    """
+    parser = argparse.ArgumentParser(description="Replay a recorded trace through the client and the chat UI.")
+    parser.add_argument("trace", help="trace file recorded with the client's trace_path")
+    parser.add_argument("--key", required=True, help="passphrase of the main channel")
+    parser.add_argument(
+        "--join", action="append", default=[], metavar="NAME:PASSPHRASE", help="further channel to join, repeatable"
+    )
+    parser.add_argument("--max-speed", action="store_true", help="replay as fast as possible")
+    parser.add_argument("--workers", type=int, default=0, help="threads decrypting large bursts")
+    parser.add_argument("--profile", metavar="PATH", help="write cProfile stats of the event loop to PATH")
+    parser.add_argument("--tracemalloc", action="store_true", help="show where the replay allocates memory")
+    args = parser.parse_args()
+
+    channels = [tuple(channel.split(":", 1)) for channel in args.join]
+    results = asyncio.run(
+        replay(args.trace, args.key, channels, args.max_speed, args.workers, args.profile, args.tracemalloc)
+    )
+
+    stages = results.pop("stages")
+    for name, value in results.items():
+        print(f"{name:<24} {value:.3f}" if isinstance(value, float) else f"{name:<24} {value}")
+    for stage, summary in stages.items():
+        if not summary["count"]:
+            continue
+        print(
+            f"{stage:<24} p50 {summary['p50'] * 1000:8.3f} ms  p99 {summary['p99'] * 1000:8.3f} ms  "
+            f"n {summary['count']}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+from crypto import get_raw_key_id
+from ring_buffer import OverflowPolicy, RingBuffer
+
+# name of the channel using the encryption key entered in the login form
+MAIN_CHANNEL_NAME: str = "main"
+
+
+class Channel:
+    """
+    Conversation with its own encryption key and receive buffer.
+
+    Channels are multiplexed over a single connection. Every message is tagged with the id of the key it has been
+    encrypted with, so the raw key id doubles as the channel id received messages are routed by.
+    """
+
+    def __init__(
+        self, name: str, encr_key: bytes, rx_buffer_size: int, rx_overflow_policy: OverflowPolicy
+    ) -> None:
+        """
+        Initialize the channel.
+
+        :param name: name of the channel shown to the user
+        :param encr_key: encryption key of the channel
+        :param rx_buffer_size: number of received messages the receive buffer holds before applying its policy
+        :param rx_overflow_policy: behaviour when a message is received while the receive buffer is full
+        """
+        self.__name = name
+        self.__rx_message_buffer: RingBuffer = RingBuffer(rx_buffer_size, rx_overflow_policy)
+        self.set_encr_key(encr_key)
+
+    def get_name(self) -> str:
+        """Get the name of the channel."""
+        return self.__name
+
+    def set_encr_key(self, encr_key: bytes) -> None:
+        """Set the encryption key, which changes the id of the channel."""
+        self.__encr_key = encr_key
+        self.__id = get_raw_key_id(encr_key)
+
+    def get_encr_key(self) -> bytes:
+        """Get the encryption key."""
+        return self.__encr_key
+
+    def get_id(self) -> bytes:
+        """Get the id of the channel, the raw id of its encryption key."""
+        return self.__id
+
+    def get_rx_message_buffer(self) -> RingBuffer:
+        """Get the receive buffer."""
+        return self.__rx_message_buffer
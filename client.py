@@ -1,162 +1,942 @@
+import asyncio
 import json
+import logging
+import os
+import random
 import socket
 import threading
 import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import TYPE_CHECKING
 
-from cryptography.fernet import Fernet, InvalidToken
-
-from tui.chat_ui import ChatTUI
-from tui.login_form import LoginTUI
+import crypto
+from channel import Channel
+from crypto import MessageCipher, PARALLEL_THRESHOLD, UNTAGGED_KEY_ID, get_message_key_id, tag_raw_message
+from history import ChatHistory
+from message import ChatMessage
+from outbox import Outbox
+from session_trace import TraceRecorder
+from sync_state import SyncState
+from protocol import (
+    FLAG_COMPRESSED,
+    FORMAT_BINARY,
+    FORMAT_JSON,
+    MESSAGE_TYPE,
+    SUPPORTED_FORMATS,
+    HEARTBEAT_TYPE,
+    SYNC_END_TYPE,
+    FrameDecoder,
+    FrameError,
+    RECV_SIZE,
+    decode_heartbeat,
+    decode_message,
+    decode_sync_end,
+    encode_frame,
+    encode_heartbeat,
+    encode_message,
+    encode_sync_request,
+)
 from user import User
 
+# the UIs are imported on first use, so importing textual overlaps with connecting to the server
+if TYPE_CHECKING:
+    from tui.chat_ui import ChatTUI
+
+# maximum number of missed messages of a channel the server sends at once when syncing after connecting
+SYNC_PAGE_SIZE: int = 500
+
+# maximum number of queued messages sent at once when flushing the outbox
+OUTBOX_BATCH_SIZE: int = 1000
+
+# number of unanswered TCP keepalive probes after which the connection is considered dead, the probes are spread over
+# the dead peer timeout
+KEEPALIVE_PROBES: int = 3
+
+# maximum number of buffers a single sendmsg call accepts
+IOV_MAX: int = os.sysconf("SC_IOV_MAX") if hasattr(os, "sysconf") else 1024
+
+# errors which can't be handed to the caller, e.g. of bursts processed by the decryption worker, are logged
+logger: logging.Logger = logging.getLogger(__name__)
+
 
 class Client:
-    def __init__(self, user_obj: User) -> None:
+    def __init__(
+        self,
+        user_obj: User,
+        crypto_workers: int = 0,
+        history_path: str or None = None,
+        outbox_path: str = ":memory:",
+        reconnect_base_delay: float = 0.5,
+        reconnect_max_delay: float = 30.0,
+        connect_timeout: float = 10.0,
+        binary_format: bool = True,
+        compression_threshold: int or None = 256,
+        coalesce_window: float = 0.0,
+        coalesce_bytes: int = 64 * 1024,
+        high_watermark: int = 10000,
+        low_watermark: int = 1000,
+        heartbeat_interval: float or None = 5.0,
+        dead_peer_timeout: float = 15.0,
+        tcp_nodelay: bool = True,
+        tcp_keepalive: bool = True,
+        keepalive_idle: int = 60,
+        trace_path: str or None = None,
+    ) -> None:
+        """
+        Initialize the client.
+
+        :param user_obj: user object shared with the UIs
+        :param crypto_workers: number of threads large received bursts get decrypted with, 0 to decrypt inline
+        :param history_path: path of the database the chat history and the sequence number of the newest message seen
+            per channel are stored in, None keeps them in memory only
+        :param outbox_path: path of the database messages are queued in until they are sent
+        :param reconnect_base_delay: maximum delay in seconds before the first reconnection attempt
+        :param reconnect_max_delay: upper limit in seconds of the exponentially growing reconnection delay
+        :param connect_timeout: time in seconds the authentication waits for the connection being established in the
+            background before failing, the connection keeps being retried meanwhile
+        :param binary_format: offer the compact binary wire format to the server, JSON is used if it isn't supported
+        :param compression_threshold: minimum size in bytes of a message to compress it before encrypting it, None
+            to never compress sent messages
+        :param coalesce_window: time in seconds to wait for further messages after a message has been submitted, so
+            they're sent with a single write, 0 sends immediately whatever is pending
+        :param coalesce_bytes: maximum number of bytes collected within the window and written by a single write
+        :param high_watermark: number of unsent messages at which the user can't submit further messages
+        :param low_watermark: number of unsent messages at which the user can submit messages again
+        :param heartbeat_interval: time in seconds between heartbeats measuring the round-trip time, None to disable
+            them. Heartbeats are only sent if the server has chosen the binary wire format.
+        :param dead_peer_timeout: time in seconds without receiving anything, despite heartbeats, after which the
+            connection is considered dead and gets re-established. Without heartbeats, e.g. over the JSON format,
+            TCP keepalive probes and the TCP user timeout detect a dead peer within this time instead, where supported.
+        :param tcp_nodelay: disable Nagle's algorithm, so messages are sent without delay
+        :param tcp_keepalive: let the operating system probe idle connections
+        :param keepalive_idle: idle time in seconds before the first keepalive probe, where supported
+        :param trace_path: path of a trace file every received frame gets recorded to for replaying it later,
+            see bench/replay.py. None disables recording.
+        """
         # user supplied user object from parameter
         self.__user = user_obj
 
+        # ciphers by channel id, built once per encryption key, see __get_cipher
+        self.__ciphers: dict = {}
+        self.__compression_threshold = compression_threshold
+
+        # optional thread pool for decrypting large bursts and a single worker keeping the bursts in order
+        self.__crypto_pool = ThreadPoolExecutor(max_workers=crypto_workers) if crypto_workers else None
+        self.__decryption_worker = ThreadPoolExecutor(max_workers=1) if crypto_workers else None
+        self.__pending_decryption: Future or None = None
+
+        self.__history_path = history_path
+
+        # opt-in recording of the received frames, closed along with the connection
+        self.__trace_recorder = TraceRecorder(trace_path) if trace_path is not None else None
+
+        # sequence number of the newest message seen per channel, and the channels which are being synced after
+        # connecting along with the newest sequence number received live meanwhile
+        self.__sync_state = SyncState(history_path if history_path is not None else ":memory:")
+        self.__syncing: dict = {}
+
+        # sequence number per channel id the stored one doesn't move past on the current connection, because the
+        # message after it has been dropped by the channel's full rx buffer without being handed over
+        self.__sync_gaps: dict = {}
+
         # create a new socket object that uses IPv4 and TCP
         self.__client = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
 
-    @staticmethod
-    def __encrypt_message(message: str, key: bytes) -> bytes:
+        # decoder splitting the received byte stream into frames, shared by authentication and messaging
+        self.__decoder = FrameDecoder()
+
+        # frames that have been received but not been processed yet
+        self.__pending_frames: list = []
+
+        # stream reader and writer of the connection when running in asyncio mode
+        self.__reader: asyncio.StreamReader or None = None
+        self.__writer: asyncio.StreamWriter or None = None
+        self.__loop: asyncio.AbstractEventLoop or None = None
+        self.__messaging_tasks: list = []
+
+        # set by close, so the messaging threads end quietly when the socket gets closed
+        self.__closed: bool = False
+
+        # set as soon as the connection to the server is established, see connect and connect_async, or the client
+        # has been closed. The error of the last failed connection attempt is shown if the authentication times out.
+        self.__connected = threading.Event()
+        self.__connect_task: asyncio.Task or None = None
+        self.__connect_timeout = connect_timeout
+        self.__connect_error: OSError or None = None
+        self.__server_address: tuple or None = None
+
+        # set while the user is authenticated on the current connection, so queued messages can be sent
+        self.__online = threading.Event()
+
+        # durable queue of messages which haven't been sent yet, flushed by one sender at a time
+        self.__outbox = Outbox(outbox_path)
+        self.__send_lock = threading.Lock()
+        self.__send_lock_async = asyncio.Lock()
+
+        # sending: time to wait for further messages, bytes per write and limits of unsent messages
+        self.__coalesce_window = coalesce_window
+        self.__coalesce_bytes = coalesce_bytes
+        self.__high_watermark = high_watermark
+        self.__low_watermark = low_watermark
+
+        # heartbeats, detecting dead connections by the time anything has last been received, and socket options
+        self.__heartbeat_interval = heartbeat_interval
+        self.__dead_peer_timeout = dead_peer_timeout
+        self.__last_received: float = time.monotonic()
+        self.__tcp_nodelay = tcp_nodelay
+        self.__tcp_keepalive = tcp_keepalive
+        self.__keepalive_idle = keepalive_idle
+
+        self.__reconnect_base_delay = reconnect_base_delay
+        self.__reconnect_max_delay = reconnect_max_delay
+
+        # wire formats offered when authenticating and the one the server has chosen for the current connection
+        self.__offered_formats: tuple = SUPPORTED_FORMATS if binary_format else ()
+        self.__wire_format: str = FORMAT_JSON
+
+    def __get_cipher(self, channel: Channel) -> MessageCipher:
         """
-        Encrypts a string using Fernet with supplied key.
+        Get the cipher for a channel's encryption key, building it only once per key.
 
-        :param message: message string to encrypt
-        :param key: encryption key
-        :return: encrypted messages
+        :param channel: channel to get the cipher of
+        :return: cipher for the channel's encryption key
         """
-        cipher = Fernet(key)
-        encrypted_message = cipher.encrypt(message.encode())
-        return encrypted_message
+        key = channel.get_encr_key()
+        cipher = self.__ciphers.get(channel.get_id())
+        if cipher is None or cipher.get_key() != key:
+            cipher = self.__ciphers[channel.get_id()] = MessageCipher(key, self.__compression_threshold)
+        return cipher
 
-    @staticmethod
-    def __decrypt_message(encrypted_message: bytes, key: bytes) -> str or None:
+    def __get_channel(self, key_id: bytes) -> Channel or None:
         """
-        Decrypts a message in bytes using Fernet with supplied key
+        Get the channel a received message belongs to by the key id it has been tagged with.
 
-        :param encrypted_message: message in bytes to decrypt
-        :param key: decryption key
-        :return: decrypted message or None if message couldn't be decrypted
+        :param key_id: raw key id of the message
+        :return: the joined channel with the key id, the main channel for untagged messages of older clients, None if
+            the message belongs to a channel which hasn't been joined
         """
-        # try to decrypt message using Fernet and provided key
-        try:
-            cipher = Fernet(key)
-            decrypted_message = cipher.decrypt(encrypted_message).decode()
-        # if it fails, set decrypted_message to None
-        except InvalidToken:
-            decrypted_message = None
-        # return the decrypted message or None according to decryption attempt success
-        return decrypted_message
+        if key_id == UNTAGGED_KEY_ID:
+            return self.__user.get_main_channel()
+        return self.__user.get_channel(key_id)
+
+    def __create_chat_ui(self) -> "ChatTUI":
+        """
+        Creates the chat UI, backed by the on-disk chat history if a history path has been supplied.
+
+        :return: chat UI object
+        """
+        from tui.chat_ui import ChatTUI
+
+        history = None
+        if self.__history_path is not None:
+            history = ChatHistory(self.__history_path, self.__user.get_main_channel().get_id())
+        return ChatTUI(user=self.__user, history=history)
+
+    def __encrypt_messages(self, message_buffer: list) -> list:
+        """
+        Encrypts a batch of messages with the ciphers of their channels.
+
+        :param message_buffer: list of (channel, message string) tuples
+        :return: list of (channel id, compressed, raw Fernet token) tuples as queued in the outbox
+        """
+        start = time.perf_counter()
+        encrypted_messages = []
+        for channel, message in message_buffer:
+            compressed, token = self.__get_cipher(channel).encrypt_raw(message)
+            encrypted_messages.append((channel.get_id(), compressed, token))
+
+        self.__user.get_stats().record(
+            "encrypt", (time.perf_counter() - start) / len(message_buffer), len(message_buffer)
+        )
+        return encrypted_messages
+
+    def __encode_messages(self, encrypted_messages: list) -> list:
+        """
+        Frames a batch of encrypted messages in the wire format of the current connection.
+
+        :param encrypted_messages: list of (channel id, compressed, raw Fernet token) tuples
+        :return: list of frames, one per message
+        """
+        if self.__wire_format == FORMAT_BINARY:
+            frames = [
+                encode_message(channel_id, token, flags=FLAG_COMPRESSED if compressed else 0)
+                for channel_id, compressed, token in encrypted_messages
+            ]
+        else:
+            frames = [
+                encode_frame(tag_raw_message(channel_id, token, compressed))
+                for channel_id, compressed, token in encrypted_messages
+            ]
+
+        stats = self.__user.get_stats()
+        stats.count("messages_sent", len(frames))
+        stats.count("bytes_sent", sum(map(len, frames)))
+        return frames
+
+    def __split_writes(self, frames: list) -> list:
+        """
+        Groups frames into writes of at most the coalescing byte budget and IOV_MAX buffers, a single frame larger than
+        the budget gets a write of its own.
+
+        :param frames: list of frames
+        :return: list of frame lists, one per write
+        """
+        writes = [[]]
+        size = 0
+        for frame in frames:
+            if writes[-1] and (size + len(frame) > self.__coalesce_bytes or len(writes[-1]) >= IOV_MAX):
+                writes.append([])
+                size = 0
+            writes[-1].append(frame)
+            size += len(frame)
+        return writes
+
+    def __send_frames(self, frames: list) -> None:
+        """
+        Writes frames to the client socket with one scatter-gather sendmsg call per write, without joining them.
+        Platforms without sendmsg join the frames of a write and use sendall.
+
+        :param frames: list of frames
+        """
+        stats = self.__user.get_stats()
+
+        for write in self.__split_writes(frames):
+            if not hasattr(self.__client, "sendmsg"):
+                self.__client.sendall(b"".join(write))
+                stats.count("send_calls")
+                continue
+
+            # sendmsg may send only a part of the buffers, continue with the rest of them
+            buffers = [memoryview(frame) for frame in write]
+            while buffers:
+                sent = self.__client.sendmsg(buffers)
+                stats.count("send_calls")
+                while buffers and sent >= len(buffers[0]):
+                    sent -= len(buffers.pop(0))
+                if sent:
+                    buffers[0] = buffers[0][sent:]
+
+    def __update_watermarks(self) -> None:
+        """
+        Pauses submitting messages when the number of unsent messages reaches the high watermark and resumes it when
+        it dropped to the low watermark, so a slow server or connection slows the user down instead of queueing
+        messages without limit.
+        """
+        unsent = self.__outbox.get_length(self.__user.get_username())
+        if unsent >= self.__high_watermark:
+            self.__user.set_tx_paused(True)
+        elif unsent <= self.__low_watermark:
+            self.__user.set_tx_paused(False)
+
+    def __flush_outbox(self) -> None:
+        """
+        Sends every queued message of the outbox using the client socket, as long as the user is online.
+        Messages stay in the outbox if sending fails, the receiving thread re-establishes the connection then.
+        """
+        stats = self.__user.get_stats()
+
+        # only the messages of the logged-in user are sent, messages of other users wait for their next login
+        username = self.__user.get_username()
+
+        with self.__send_lock:
+            while self.__online.is_set():
+                pending = self.__outbox.get_pending(username, OUTBOX_BATCH_SIZE)
+                if not pending:
+                    return
+
+                # frame the encrypted messages in the wire format of the current connection
+                frames = self.__encode_messages([encrypted_message for _, *encrypted_message in pending])
+
+                # send the pending messages to the server with as few writes as possible
+                start = time.perf_counter()
+                try:
+                    self.__send_frames(frames)
+                except OSError:
+                    # make sure the receiving thread notices the broken connection as well
+                    self.__online.clear()
+                    try:
+                        self.__client.shutdown(socket.SHUT_RDWR)
+                    except OSError:
+                        pass
+                    return
+                stats.record("send", time.perf_counter() - start)
+
+                self.__outbox.remove_up_to(username, pending[-1][0])
+                self.__update_watermarks()
+
+    def __collect_tx_messages(self) -> list:
+        """
+        Waits for a message in the tx message buffer and collects further messages submitted within the coalescing
+        window, until the byte budget has been reached.
+
+        :return: list of (channel, message string) tuples
+        """
+        user = self.__user
+
+        # block until a message has been submitted
+        message_buffer = [user.get_tx_message()]
+        size = len(message_buffer[0][1])
+
+        # wait for further messages for the rest of the window
+        deadline = time.perf_counter() + self.__coalesce_window
+        while size < self.__coalesce_bytes and (remaining := deadline - time.perf_counter()) > 0:
+            try:
+                message = user.get_tx_message(timeout=remaining)
+            except TimeoutError:
+                break
+            message_buffer.append(message)
+            size += len(message[1])
+
+        # take every other pending message along
+        return message_buffer + user.drain_tx_message_buffer()
 
     def __send_message(self) -> None:
         """
-        Polls the tx message buffer for new messages and sends them using the client socket.
+        Waits for messages in the tx message buffer, queues them in the outbox and sends them using the client socket.
         """
-        # use user object and client socket object
         user = self.__user
-        sock = self.__client
 
-        # get encryption key from the user object
-        encr_key = self.__user.get_encr_key()
+        # send messages which have been queued before, e.g. by a previous session that crashed
+        self.__flush_outbox()
 
         # as long as the thread runs, send user input messages
         while True:
-            # check every 100ms to avoid using too many cpu cycles
-            time.sleep(0.1)
+            message_buffer = self.__collect_tx_messages()
+
+            # queue the messages durably before sending them, so they are kept if the connection is down
+            self.__outbox.append(user.get_username(), self.__encrypt_messages(message_buffer))
+            self.__update_watermarks()
+            self.__flush_outbox()
+
+    def __recv_frames(self) -> list:
+        """
+        Receives data using the client socket and returns every complete frame.
+
+        Blocks until at least one complete frame has been received, a single recv may yield several frames.
+
+        :return: list of received frame payloads
+        """
+        # return frames that have already been received, e.g. together with the authentication feedback
+        if self.__pending_frames:
+            frames = self.__pending_frames
+            self.__pending_frames = []
+            return frames
+
+        frames = []
+        while not frames:
+            data = self.__client.recv(RECV_SIZE)
+            if not data:
+                raise ConnectionResetError("Connection closed by the server")
+            self.__last_received = time.monotonic()
+            self.__user.get_stats().count("bytes_received", len(data))
+            frames = self.__decoder.feed(data)
+        return frames
+
+    def __recv_frame(self) -> bytes:
+        """
+        Receives a single frame, keeping any further frames for the next receive call.
+
+        :return: received frame payload
+        """
+        frames = self.__recv_frames()
+        self.__pending_frames = frames[1:]
+        return frames[0]
+
+    def __process_frames(self, frames: list) -> None:
+        """
+        Routes received message frames to their channels, decrypts them and appends them to the channels' rx message
+        buffers.
 
-            # get message buffer list from user object
-            message_buffer = user.get_tx_message_buffer()
+        :param frames: list of received frame payloads
+        """
+        stats = self.__user.get_stats()
+        binary = self.__wire_format == FORMAT_BINARY
+
+        start = time.perf_counter()
+
+        # route every message to its channel by the key id it has been tagged with, messages of channels that haven't
+        # been joined are skipped without decrypting them
+        routed_messages = {}
+        sequences = {}
+        sync_ends = []
+        received = 0
+        skipped = 0
+        invalid = 0
+        for frame in frames:
+            if binary:
+                # frames without a frame type can't be routed
+                if not frame:
+                    invalid += 1
+                    continue
+
+                # split binary frames into username, key id and a view of the ciphertext, skipping other frame types.
+                # A malformed frame is dropped, the frames around it are still processed.
+                frame_type = frame[0]
+                try:
+                    if frame_type == HEARTBEAT_TYPE:
+                        self.__on_heartbeat(frame)
+                        continue
+                    if frame_type == SYNC_END_TYPE:
+                        sync_ends.append(decode_sync_end(frame))
+                        continue
+                    if frame_type != MESSAGE_TYPE:
+                        continue
+                    username, key_id, flags, sequence, ciphertext = decode_message(frame)
+                except (FrameError, ValueError):
+                    invalid += 1
+                    continue
+                encrypted_message = (key_id, ciphertext, bool(flags & FLAG_COMPRESSED))
+            else:
+                # convert received user data from json to a dict, dropping frames which aren't a message
+                try:
+                    data = json.loads(frame)
+                    username, encrypted_message = data["username"], data["message"].encode()
+                except (ValueError, KeyError, TypeError, AttributeError):
+                    invalid += 1
+                    continue
+                key_id = get_message_key_id(encrypted_message)
+                sequence = 0
+
+            received += 1
+            channel = self.__get_channel(key_id)
+            if channel is None:
+                skipped += 1
+                continue
+
+            # sequence numbers are only tracked for joined channels, other channels' messages are never synced
+            if sequence > sequences.get(key_id, 0):
+                sequences[key_id] = sequence
+            senders, encrypted_messages = routed_messages.setdefault(channel, ([], []))
+            senders.append((username, sequence))
+            encrypted_messages.append(encrypted_message)
+
+        # decrypt the messages of each channel at once, using the thread pool if there is one
+        decrypted_channels = []
+        for channel, (senders, encrypted_messages) in routed_messages.items():
+            cipher = self.__get_cipher(channel)
+            if binary:
+                decrypted_messages = cipher.decrypt_raw_messages(encrypted_messages, self.__crypto_pool)
+            else:
+                decrypted_messages = cipher.decrypt_messages(encrypted_messages, self.__crypto_pool)
+            decrypted_channels.append((channel, senders, decrypted_messages))
+            skipped += decrypted_messages.count(None)
+
+        if invalid:
+            stats.count("frames_invalid", invalid)
+        if received:
+            stats.count("messages_received", received)
+            stats.record("decrypt", (time.perf_counter() - start) / received, received)
+            stats.count("messages_undecryptable", skipped)
+
+        # if a message could be decrypted, add it to the rx message buffer of its channel as a record, it only gets
+        # formatted when it's shown. The lowest sequence number of the messages a full rx buffer drops is kept per
+        # channel, so they are synced again.
+        received_at = time.time()
+        dropped = {}
+        for channel, senders, decrypted_messages in decrypted_channels:
+            for (username, sequence), decrypted_message in zip(senders, decrypted_messages):
+                if decrypted_message is not None:
+                    dropped_message = self.__user.add_to_rx_message_buffer(
+                        message=ChatMessage(username, decrypted_message, received_at, sequence), channel=channel
+                    )
+                    # the buffer drops its messages in the order they have been received, the first one is the lowest
+                    if dropped_message is not None and dropped_message.get_sequence():
+                        dropped.setdefault(channel.get_id(), dropped_message.get_sequence())
+
+        # only advance the sequence numbers once the messages have been handed to the channels
+        if sequences or sync_ends or dropped:
+            self.__update_sync_state(sequences, sync_ends, dropped)
+
+        stats.count("frames_processed", len(frames))
+
+    def __start_sync(self) -> None:
+        """
+        Asks the server for the messages of every joined channel which have been missed while the client was offline.
+        Channels which have never been synced only ask for the current sequence number, they haven't missed anything.
+        """
+        # the sync asks for the messages after the stored sequence numbers, which are before any dropped message
+        self.__syncing = {}
+        self.__sync_gaps = {}
+        requests = []
+        for channel in self.__user.get_channels():
+            channel_id = channel.get_id()
+            last_sequence = self.__sync_state.get_last_sequence(channel_id)
+            if last_sequence is None:
+                requests.append(encode_sync_request(channel_id, 0, 0))
+            else:
+                requests.append(encode_sync_request(channel_id, last_sequence, SYNC_PAGE_SIZE))
+            self.__syncing[channel_id] = 0
+
+        self.__user.get_stats().count("sync_requests", len(requests))
+        self.__send_control_frames(requests)
+
+    def __update_sync_state(self, sequences: dict, sync_ends: list, dropped: dict) -> None:
+        """
+        Stores the sequence numbers of the newest received messages and asks for the next page of channels which are
+        being synced and have further missed messages.
+
+        :param sequences: dict of the newest sequence number received per channel id
+        :param sync_ends: list of (channel id, sequence number, more) tuples of the received sync ends
+        :param dropped: dict of the lowest sequence number of the messages the rx buffer dropped per channel id
+        """
+        syncing = self.__syncing
+        gaps = self.__sync_gaps
 
-            # if message buffer is empty, skip sending procedure
-            if not message_buffer:
+        # a dropped message has been counted as seen, possibly by an earlier burst, but has never been handed over.
+        # The stored sequence number is moved back before it and stays there for the rest of the connection, so the
+        # next sync fetches it again, along with the later messages that have been handed over already.
+        if dropped:
+            for channel_id, sequence in dropped.items():
+                gaps[channel_id] = min(sequence - 1, gaps.get(channel_id, sequence))
+            self.__sync_state.rewind({channel_id: gaps[channel_id] for channel_id in dropped})
+
+        # messages received live while a channel is being synced are newer than the missed ones, their sequence
+        # numbers are only stored once the sync is complete, so the missed messages are requested again otherwise
+        updates = {}
+        for channel_id, sequence in sequences.items():
+            if channel_id in syncing:
+                syncing[channel_id] = max(syncing[channel_id], sequence)
+            else:
+                updates[channel_id] = sequence
+
+        requests = []
+        for channel_id, sequence, more in sync_ends:
+            if channel_id not in syncing:
                 continue
+            if more:
+                updates[channel_id] = sequence
+                requests.append(encode_sync_request(channel_id, sequence, SYNC_PAGE_SIZE))
+            else:
+                updates[channel_id] = max(sequence, syncing.pop(channel_id))
+
+        # stored sequence numbers don't move past a dropped message
+        for channel_id, gap in gaps.items():
+            if channel_id in updates:
+                updates[channel_id] = min(updates[channel_id], gap)
+        if updates:
+            self.__sync_state.update(updates)
+        if requests:
+            self.__user.get_stats().count("sync_requests", len(requests))
+            self.__send_control_frames(requests)
 
-            # send every message in the buffer
-            for msg in message_buffer:
-                # encrypt the message using the __encrypt_message method
-                encrypted_msg = self.__encrypt_message(msg, encr_key)
+    def __send_control_frames(self, frames: list) -> None:
+        """
+        Sends frames other than messages, e.g. sync requests, on the current connection from any thread or the
+        event loop. A broken connection is left to the receiving side.
 
-                # send the encrypted message to the server
-                sock.send(encrypted_msg)
+        :param frames: list of length-prefixed frames
+        """
+        try:
+            if self.__writer is not None:
+                # asyncio transports aren't thread-safe and large bursts are processed in the thread pool, so the frames
+                # are written by the event loop. Writing complete frames doesn't interleave with other writes.
+                self.__loop.call_soon_threadsafe(self.__writer.writelines, frames)
+            else:
+                with self.__send_lock:
+                    self.__client.sendall(b"".join(frames))
+        except OSError:
+            pass
 
-                # iterate every 100ms to avoid losing messages when transmitting (too fast)
-                time.sleep(0.1)
+    def __on_heartbeat(self, frame: bytes) -> None:
+        """
+        Records the round-trip time of a heartbeat echoed by the server.
 
-            # clear the message buffer after every message has been sent
-            user.clear_tx_message_buffer()
+        :param frame: payload of the heartbeat frame
+        """
+        round_trip_time = (time.monotonic_ns() - decode_heartbeat(frame)) / 1e9
+        self.__user.get_stats().sample("rtt", round_trip_time)
+
+    def __is_peer_dead(self) -> bool:
+        """
+        Checks whether nothing has been received within the dead peer timeout, although heartbeats have been sent.
+
+        :return: True if the connection is considered dead
+        """
+        if time.monotonic() - self.__last_received <= self.__dead_peer_timeout:
+            return False
+        self.__user.get_stats().count("dead_peer_timeouts")
+        self.__online.clear()
+        return True
+
+    def __send_heartbeats(self) -> None:
+        """
+        Sends a heartbeat every heartbeat interval while the binary wire format is used, and shuts down a connection
+        which is considered dead, so the receiving thread re-establishes it.
+        """
+        while not self.__closed:
+            time.sleep(self.__heartbeat_interval)
+            if not self.__online.is_set() or self.__wire_format != FORMAT_BINARY:
+                continue
+
+            try:
+                if self.__is_peer_dead():
+                    self.__client.shutdown(socket.SHUT_RDWR)
+                    continue
+
+                with self.__send_lock:
+                    self.__client.sendall(encode_heartbeat(time.monotonic_ns()))
+            except OSError:
+                # the receiving thread notices the broken connection
+                pass
+
+    async def __send_heartbeats_async(self) -> None:
+        """
+        Sends a heartbeat every heartbeat interval while the binary wire format is used, and aborts a connection
+        which is considered dead, so the receiving coroutine re-establishes it.
+        """
+        while True:
+            await asyncio.sleep(self.__heartbeat_interval)
+            if not self.__online.is_set() or self.__wire_format != FORMAT_BINARY:
+                continue
+
+            # abort instead of closing, closing would wait for buffered data to be sent to the dead peer
+            if self.__is_peer_dead():
+                self.__writer.transport.abort()
+                continue
+
+            async with self.__send_lock_async:
+                try:
+                    self.__writer.write(encode_heartbeat(time.monotonic_ns()))
+                    await self.__writer.drain()
+                except OSError:
+                    # the receiving coroutine notices the broken connection
+                    pass
+
+    def __configure_socket(self, sock: socket.socket) -> None:
+        """
+        Applies the configured TCP options to a connected socket.
+
+        :param sock: connected socket
+        """
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, int(self.__tcp_nodelay))
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, int(self.__tcp_keepalive))
+
+        # the idle time before keepalive probes can't be tuned on every platform
+        if self.__tcp_keepalive and hasattr(socket, "TCP_KEEPIDLE"):
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPIDLE, self.__keepalive_idle)
+
+        # heartbeats only detect dead peers over the binary format, let the operating system detect them within the
+        # dead peer timeout as well: an idle connection by its unanswered keepalive probes, instead of the default
+        # 9 probes 75 seconds apart, and a connection with unacknowledged data by the TCP user timeout
+        if self.__tcp_keepalive and hasattr(socket, "TCP_KEEPINTVL") and hasattr(socket, "TCP_KEEPCNT"):
+            interval = max(1, int(self.__dead_peer_timeout / KEEPALIVE_PROBES))
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPINTVL, interval)
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPCNT, KEEPALIVE_PROBES)
+        if hasattr(socket, "TCP_USER_TIMEOUT"):
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_USER_TIMEOUT, int(self.__dead_peer_timeout * 1000))
 
     def __receive_message(self) -> None:
         """
         Receives messages using the client socket, decrypts them and appends them to the rx message buffer.
         """
-        # use the clients socket
-        sock = self.__client
+        # as long as the thread runs, receive messages and process every frame of the received burst
+        while True:
+            try:
+                frames = self.__recv_frames()
+            except (OSError, FrameError):
+                # a frame header exceeding the maximum frame size means the byte stream can't be split anymore, the
+                # connection is re-established like a broken one
+                if self.__closed or not self.__reconnect():
+                    return
+                continue
+
+            if self.__trace_recorder is not None:
+                self.__trace_recorder.record(frames, self.__wire_format)
+
+            self.__dispatch_frames(frames)
+
+    def __dispatch_frames(self, frames: list) -> None:
+        """
+        Processes a received burst, large bursts are handed to the decryption worker so the socket keeps being read.
+        Later bursts have to follow them through the worker as long as it is busy to keep the messages in order.
+
+        :param frames: list of received frame payloads
+        """
+        pending = self.__pending_decryption
+        if self.__decryption_worker is not None and (
+            len(frames) >= PARALLEL_THRESHOLD or (pending is not None and not pending.done())
+        ):
+            self.__pending_decryption = self.__decryption_worker.submit(self.__process_frames, frames)
+            self.__pending_decryption.add_done_callback(self.__on_burst_processed)
+        else:
+            self.__process_frames(frames)
+
+    def __on_burst_processed(self, future: Future) -> None:
+        """
+        Counts and logs the error of a burst the decryption worker failed to process, its messages are lost.
+
+        :param future: future of the processed burst
+        """
+        if future.cancelled() or future.exception() is None:
+            return
+        self.__user.get_stats().count("bursts_failed")
+        logger.error("Processing a received burst failed", exc_info=future.exception())
+
+    async def __recv_frames_async(self) -> list:
+        """
+        Receives data using the connection's stream reader and returns every complete frame.
+
+        :return: list of received frame payloads
+        """
+        # return frames that have already been received, e.g. together with the authentication feedback
+        if self.__pending_frames:
+            frames = self.__pending_frames
+            self.__pending_frames = []
+            return frames
+
+        frames = []
+        while not frames:
+            data = await self.__reader.read(RECV_SIZE)
+            if not data:
+                raise ConnectionResetError("Connection closed by the server")
+            self.__last_received = time.monotonic()
+            self.__user.get_stats().count("bytes_received", len(data))
+            frames = self.__decoder.feed(data)
+        return frames
+
+    async def __flush_outbox_async(self) -> None:
+        """
+        Sends every queued message of the outbox using the connection's stream writer, as long as the user is online.
+        Messages stay in the outbox if sending fails, the receiving coroutine re-establishes the connection then.
+        """
+        stats = self.__user.get_stats()
+
+        # only the messages of the logged-in user are sent, messages of other users wait for their next login
+        username = self.__user.get_username()
+
+        async with self.__send_lock_async:
+            while self.__online.is_set():
+                pending = self.__outbox.get_pending(username, OUTBOX_BATCH_SIZE)
+                if not pending:
+                    return
+
+                frames = self.__encode_messages([encrypted_message for _, *encrypted_message in pending])
+
+                # the transport writes the frames of each write with a single call
+                start = time.perf_counter()
+                try:
+                    for write in self.__split_writes(frames):
+                        self.__writer.writelines(write)
+                        await self.__writer.drain()
+                        stats.count("send_calls")
+                except OSError:
+                    self.__online.clear()
+                    self.__writer.close()
+                    return
+                stats.record("send", time.perf_counter() - start)
+
+                self.__outbox.remove_up_to(username, pending[-1][0])
+                self.__update_watermarks()
+
+    async def __send_message_async(self) -> None:
+        """
+        Waits for messages in the tx message buffer, queues them in the outbox and writes them to the connection's
+        stream writer.
+        """
+        user = self.__user
 
-        # get encryption key from user object
-        decr_key = self.__user.get_encr_key()
+        # the tx listener may be called from any thread, so wake up the coroutine thread-safe
+        loop = asyncio.get_running_loop()
+        wakeup = asyncio.Event()
+        user.set_tx_listener(lambda: loop.call_soon_threadsafe(wakeup.set))
+
+        # send messages which have been queued before, e.g. by a previous session that crashed
+        await self.__flush_outbox_async()
 
-        # as long as the thread runs, receive messages
         while True:
-            # receive user data as json and convert to dict
-            received_data_json = sock.recv(1024).decode("utf-8")
-            received_data = json.loads(received_data_json)
+            # clear the event before draining, so messages added while sending aren't missed
+            wakeup.clear()
+            message_buffer = user.drain_tx_message_buffer()
 
-            # decrypt message using __decrypt_message method
-            decrypted_message = self.__decrypt_message(received_data["message"].encode(), decr_key)
+            # wait for further messages for the rest of the coalescing window, until the byte budget has been reached
+            deadline = loop.time() + self.__coalesce_window
+            size = sum(len(message) for _, message in message_buffer)
+            while message_buffer and size < self.__coalesce_bytes and (remaining := deadline - loop.time()) > 0:
+                try:
+                    await asyncio.wait_for(wakeup.wait(), remaining)
+                except asyncio.TimeoutError:
+                    break
+                wakeup.clear()
+                further_messages = user.drain_tx_message_buffer()
+                message_buffer += further_messages
+                size += sum(len(message) for _, message in further_messages)
 
-            # if message could be decrypted, add it to the rx message buffer
-            if decrypted_message is not None:
-                self.__user.add_to_rx_message_buffer(message=f"{received_data['username']}: {decrypted_message}")
+            if message_buffer:
+                # queue the messages durably before sending them, so they are kept if the connection is down
+                self.__outbox.append(user.get_username(), self.__encrypt_messages(message_buffer))
+                self.__update_watermarks()
+                await self.__flush_outbox_async()
 
-    @staticmethod
-    def __do_login(sock: socket.socket, username: str, pw_hash: str) -> str:
+            await wakeup.wait()
+
+    async def __receive_message_async(self) -> None:
         """
-        Login to the server using the client's socket and provided credentials from the user object.
+        Reads messages from the connection's stream reader, decrypts them and appends them to the rx message buffer.
+        """
+        while True:
+            try:
+                frames = await self.__recv_frames_async()
+            except (OSError, FrameError):
+                # the byte stream can't be split anymore, see __receive_message
+                if self.__closed or not await self.__reconnect_async():
+                    return
+                continue
 
-        :param sock: The client's socket
-        :param username: The username of the user requesting the log-in
-        :param pw_hash: The pw_hash of the user requesting the log-in
-        :return: A string indicating the success of the login operation ("OK"/"NOT OK")
+            if self.__trace_recorder is not None:
+                self.__trace_recorder.record(frames, self.__wire_format)
+
+            # large bursts are decrypted by the worker without waiting for them, so the event loop keeps running and
+            # the stream keeps being read meanwhile
+            self.__dispatch_frames(frames)
+
+    def __build_auth_request(self, operation: str, username: str, pw_hash: str) -> bytes:
         """
-        # set the operation to send to the server as "login"
-        operation = "login"
+        Builds the framed authentication request sent to the server.
 
+        :param operation: Set to "register" or "login"
+        :param username: The username of the user requesting the authentication
+        :param pw_hash: The pw_hash of the user requesting the authentication
+        :return: framed authentication request
+        """
         # put user credentials into a dict and convert to json
         user_data = {"operation": operation, "username": username, "pw_hash": pw_hash}
+
+        # offer the wire formats the client supports, servers which don't know them ignore the field
+        if self.__offered_formats:
+            user_data["formats"] = list(self.__offered_formats)
         user_data_json = json.dumps(user_data)
 
-        # send user data and requested operation to the server
-        sock.send(user_data_json.encode("utf-8"))
+        return encode_frame(user_data_json.encode("utf-8"))
+
+    def __do_login(self, username: str, pw_hash: str) -> str:
+        """
+        Login to the server using the client's socket and provided credentials from the user object.
+
+        :param username: The username of the user requesting the log-in
+        :param pw_hash: The pw_hash of the user requesting the log-in
+        :return: A string indicating the success of the login operation ("OK"/"NOT OK")
+        """
+        # send user data and "login" as requested operation to the server
+        self.__client.sendall(self.__build_auth_request("login", username, pw_hash))
 
         # receive the server's feedback to sent credentials
-        server_feedback = sock.recv(1024).decode("utf-8")
+        server_feedback = self.__recv_frame().decode("utf-8")
 
         return server_feedback
 
-    @staticmethod
-    def __do_registration(sock: socket.socket, username: str, pw_hash: str) -> str:
+    def __do_registration(self, username: str, pw_hash: str) -> str:
         """
         Register to the server using the client's socket and provided credentials from the user object.
 
-        :param sock: The client's socket
         :param username: The username of the user requesting the registration
         :param pw_hash: The pw_hash of the user requesting the registration
         :return: A string indicating the success of the login operation ("OK"/"NOT OK")
         """
-        # set the operation to send to the server as "register"
-        operation = "register"
-
-        # put user credentials into a dict and convert to json
-        user_data = {"operation": operation, "username": username, "pw_hash": pw_hash}
-        user_data_json = json.dumps(user_data)
-
-        # send user data and requested operation to the server
-        sock.send(user_data_json.encode("utf-8"))
+        # send user data and "register" as requested operation to the server
+        self.__client.sendall(self.__build_auth_request("register", username, pw_hash))
 
         # receive the server's feedback to sent credentials
-        server_feedback = sock.recv(1024).decode("utf-8")
+        server_feedback = self.__recv_frame().decode("utf-8")
 
         return server_feedback
 
@@ -166,47 +946,283 @@ class Client:
 
         :return: A string indicating the success of the authentication attempt ("OK"/"NOT OK")
         """
+        # wait for the connection, which may still be established in the background during startup
+        if not self.__connected.wait(self.__connect_timeout):
+            raise self.__get_connect_timeout_error()
+        if self.__closed:
+            raise ConnectionAbortedError("Client has been closed")
+
         # get user supplied username and password (hash) from the user object
         username = self.__user.get_username()
         passwd_hash = self.__user.get_pw_hash()
 
         # if user has requested to register, start the registration procedure
         if self.__user.get_do_registration():
-            server_feedback = self.__do_registration(self.__client, username, passwd_hash)
+            server_feedback = self.__do_registration(username, passwd_hash)
         # if not, start the login procedure
         else:
-            server_feedback = self.__do_login(self.__client, username, passwd_hash)
+            server_feedback = self.__do_login(username, passwd_hash)
 
         return server_feedback
 
-    def __handle_authentication(self) -> None:
+    async def __authenticate_user_async(self) -> bool:
         """
-        Initializes the user authentication and communicates with the GUI via polling the user object.
+        Authenticate the user using the connection's streams with the provided credentials from the user object.
+
+        :return: True if the user has been authenticated, False if not
         """
+        # wait for the connection, which may still be established in the background during startup, shielded so it
+        # keeps being retried if waiting times out
+        if self.__connect_task is not None:
+            try:
+                await asyncio.wait_for(asyncio.shield(self.__connect_task), self.__connect_timeout)
+            except asyncio.TimeoutError:
+                raise self.__get_connect_timeout_error() from None
+
         user = self.__user
+        operation = "register" if user.get_do_registration() else "login"
 
-        # while user has not been authed, try to auth the user
-        while not user.get_authed():
-            # as long as the user has not requested to log-in (via the LoginTUI), wait
-            while not user.get_start_authentication():
-                time.sleep(0.1)
+        # send user data and requested operation to the server
+        self.__writer.write(self.__build_auth_request(operation, user.get_username(), user.get_pw_hash()))
+        await self.__writer.drain()
 
-            # get server feedback from the authentication method
-            server_feedback = self.__authenticate_user()
+        # receive the server's feedback to sent credentials, keeping any further frames for the messaging
+        frames = await self.__recv_frames_async()
+        self.__pending_frames = frames[1:]
+        server_feedback = frames[0].decode("utf-8")
 
-            # set auth status of the user object according to the server feedback
-            if server_feedback == "OK":
-                user.set_authed(True)
-            else:
-                user.set_authed(False)
+        return self.__on_authenticated(server_feedback)
+
+    async def __authenticate_user_in_thread(self) -> bool:
+        """
+        Authenticate the user using the client's blocking socket in a separate thread, so it can be awaited by the
+        login form without blocking its event loop.
 
-            # mark authentication attempt as done
-            user.set_start_authentication(False)
+        :return: True if the user has been authenticated, False if not
+        """
+        try:
+            server_feedback = await asyncio.to_thread(self.__authenticate_user)
+        except asyncio.CancelledError:
+            # the login form is exiting, closing the client wakes up the thread, which would keep the executor and
+            # with it the login form from shutting down otherwise
+            self.close()
+            raise
+        return self.__on_authenticated(server_feedback)
+
+    def __get_connect_timeout_error(self) -> ConnectionError:
+        """
+        Get the error the authentication fails with if the connection hasn't been established in time.
+
+        :return: error naming the reason of the last failed connection attempt, if there has been one
+        """
+        if self.__connect_error is None:
+            return ConnectionError(f"Server not reachable within {self.__connect_timeout:g}s")
+        return ConnectionError(f"Server not reachable ({self.__connect_error})")
+
+    def __on_authenticated(self, server_feedback: str) -> bool:
+        """
+        Sets the auth status of the user object according to the server feedback. If the user has been
+        authenticated, the client is online and later authentications on new connections are logins.
+
+        :param server_feedback: server feedback to the authentication request ("OK"/"NOT OK"), servers supporting
+            the negotiation of wire formats append the chosen format to "OK", e.g. "OK binary"
+        :return: True if the user has been authenticated, False if not
+        """
+        status, _, wire_format = server_feedback.partition(" ")
+        authed = status == "OK"
+        self.__user.set_authed(authed)
+
+        if authed:
+            self.__wire_format = wire_format if wire_format in self.__offered_formats else FORMAT_JSON
+            self.__user.set_do_registration(False)
+
+            # catching up on missed messages is part of the binary format, servers speaking JSON don't number them
+            if self.__wire_format == FORMAT_BINARY:
+                self.__start_sync()
+
+            self.__online.set()
+            self.__user.set_connected(True)
+
+        return authed
+
+    def __get_reconnect_delay(self, attempt: int) -> float:
+        """
+        Get the delay before a connection attempt using exponential backoff with full jitter, so clients losing their
+        connection at the same time don't reconnect at the same time.
+
+        :param attempt: number of failed attempts so far
+        :return: delay in seconds
+        """
+        return random.uniform(0, min(self.__reconnect_max_delay, self.__reconnect_base_delay * 2 ** attempt))
+
+    def __on_connect_failed(self, counter: str, action: str, error: Exception, delay: float) -> None:
+        """
+        Counts and logs a failed connection attempt before backing off. Nothing is printed, stdout belongs to the UI
+        and would be flooded by the retries of many headless clients. The chat UI shows the counters instead.
+
+        :param counter: name of the stats counter of the failed attempts
+        :param action: "Connecting" or "Reconnecting"
+        :param error: error the attempt failed with
+        :param delay: delay in seconds before the next attempt
+        """
+        self.__user.get_stats().count(counter)
+        logger.info("%s failed (%s), retrying in %.1fs", action, error, delay)
+
+    def __reconnect(self) -> bool:
+        """
+        Re-establishes a lost connection using the client's socket: reconnects, logs in again with the credentials
+        stored on the user object and sends the messages queued meanwhile.
+
+        :return: True if the connection has been re-established, False if the client has been closed or the server
+            has rejected the credentials
+        """
+        self.__online.clear()
+        self.__user.set_connected(False)
+
+        # back off after every failed attempt, whether connecting or logging in failed, so a server accepting
+        # connections but dropping them isn't hammered. The attempts only start over once the user is logged in again.
+        attempt = 0
+        while not self.__closed:
+            self.__client.close()
+            try:
+                self.__open_connection()
+                authed = self.__on_authenticated(self.__authenticate_user())
+            except (OSError, FrameError, ValueError) as error:
+                if self.__closed:
+                    break
+                delay = self.__get_reconnect_delay(attempt)
+                attempt += 1
+                self.__on_connect_failed("reconnect_failures", "Reconnecting", error, delay)
+                time.sleep(delay)
+                continue
+
+            if not authed:
+                self.__client.close()
+                self.__on_credentials_rejected()
+                return False
+
+            self.__flush_outbox()
+            return True
+        return False
+
+    async def __reconnect_async(self) -> bool:
+        """
+        Re-establishes a lost connection using asyncio streams: reconnects, logs in again with the credentials stored
+        on the user object and sends the messages queued meanwhile.
+
+        :return: True if the connection has been re-established, False if the client has been closed or the server
+            has rejected the credentials
+        """
+        self.__online.clear()
+        self.__user.set_connected(False)
+
+        # back off after every failed attempt, whether connecting or logging in failed, see __reconnect
+        attempt = 0
+        while not self.__closed:
+            self.__writer.close()
+            try:
+                await self.__open_connection_async()
+                authed = await self.__authenticate_user_async()
+            except (OSError, FrameError, ValueError) as error:
+                if self.__closed:
+                    break
+                delay = self.__get_reconnect_delay(attempt)
+                attempt += 1
+                self.__on_connect_failed("reconnect_failures", "Reconnecting", error, delay)
+                await asyncio.sleep(delay)
+                continue
+
+            if not authed:
+                self.__writer.close()
+                self.__on_credentials_rejected()
+                return False
+
+            await self.__flush_outbox_async()
+            return True
+        return False
+
+    def __on_credentials_rejected(self) -> None:
+        """
+        Gives up reconnecting after the server has rejected the stored credentials, e.g. because it has lost its
+        accounts when restarting, and tells the UI. Unsent messages are kept in the outbox.
+        """
+        self.__user.get_stats().count("reconnects_rejected")
+        self.__user.set_connection_error("The server rejected the stored credentials, restart PyTalk to log in again.")
 
     def __init_messaging(self) -> None:
         """
         Sets up the messaging (sending and receiving) threads and ChatTUI and starts them.
         """
+        # initialize and start the messaging threads
+        self.start_messaging()
+
+        # create chat_ui object from ChatTUI and run the chat UI
+        chat_ui = self.__create_chat_ui()
+        chat_ui.run()
+
+        if self.__trace_recorder is not None:
+            self.__trace_recorder.close()
+
+    def __init_authentication(self) -> None:
+        """
+        Sets up the LoginTUI, which awaits the authentication running in a thread, and runs it.
+        """
+        from tui.login_form import LoginTUI
+
+        # create object for LoginTUI and run LoginTUI
+        login_form = LoginTUI(self.__user, authenticator=self.__authenticate_user_in_thread)
+
+        # run login form, exit program if return code is 1 (keyboard interruption)
+        return_code = login_form.run()
+        if return_code == 1:
+            exit(1)
+
+    def __set_credentials(self, username: str, password: str, encr_key: str, register: bool) -> None:
+        """
+        Writes the credentials to the user object, like the login form does.
+
+        :param username: name of the user
+        :param password: password of the user
+        :param encr_key: passphrase the encryption key gets derived from
+        :param register: True to register a new account, False to log in
+        """
+        self.__user.set_username(username=username)
+        self.__user.set_pw_hash(password=password)
+        self.__user.set_encr_key(key=encr_key)
+        self.__user.set_do_registration(register)
+
+    def login(self, username: str, password: str, encr_key: str, register: bool = False) -> bool:
+        """
+        Headless alternative to the login form. Authenticates the user using the client's socket.
+
+        :param username: name of the user
+        :param password: password of the user
+        :param encr_key: passphrase the encryption key gets derived from
+        :param register: True to register a new account, False to log in
+        :return: True if the user has been authenticated, False if not
+        """
+        self.__set_credentials(username, password, encr_key, register)
+        return self.__on_authenticated(self.__authenticate_user())
+
+    async def login_async(self, username: str, password: str, encr_key: str, register: bool = False) -> bool:
+        """
+        Headless alternative to the login form. Authenticates the user using the connection's streams.
+
+        :param username: name of the user
+        :param password: password of the user
+        :param encr_key: passphrase the encryption key gets derived from
+        :param register: True to register a new account, False to log in
+        :return: True if the user has been authenticated, False if not
+        """
+        # deriving the encryption key takes a while, possibly waiting for another thread deriving a key, so it runs in a
+        # thread to keep the event loop and e.g. the other users of a load test running meanwhile
+        await asyncio.to_thread(self.__set_credentials, username, password, encr_key, register)
+        return await self.__authenticate_user_async()
+
+    def start_messaging(self) -> None:
+        """
+        Starts the threads sending the tx message buffer and filling the rx message buffer.
+        """
         # initialize the messaging for receiving and sending messages
         send_thread = threading.Thread(target=self.__send_message)
         recv_thread = threading.Thread(target=self.__receive_message)
@@ -219,47 +1235,177 @@ class Client:
         send_thread.start()
         recv_thread.start()
 
-        # create chat_ui object from ChatTUI and run the chat UI
-        chat_ui = ChatTUI(user=self.__user)
-        chat_ui.run()
+        if self.__heartbeat_interval is not None:
+            threading.Thread(target=self.__send_heartbeats, daemon=True).start()
 
-    def __init_authentication(self) -> None:
+    def start_messaging_async(self) -> None:
         """
-        Sets up the authentication thread and ChatTUI and starts them.
+        Starts the coroutines sending the tx message buffer and filling the rx message buffer as tasks
+        in the running event loop.
         """
-        # initialize and start the client class' authentication method as thread
-        auth_thread = threading.Thread(target=self.__handle_authentication)
-        auth_thread.daemon = True
-        auth_thread.start()
+        self.__messaging_tasks = [
+            asyncio.create_task(self.__send_message_async()),
+            asyncio.create_task(self.__receive_message_async()),
+        ]
 
-        # create object for LoginTUI and run LoginTUI
-        login_form = LoginTUI(self.__user)
+        if self.__heartbeat_interval is not None:
+            self.__messaging_tasks.append(asyncio.create_task(self.__send_heartbeats_async()))
 
-        # run login form, exit program if return code is 1 (keyboard interruption)
-        return_code = login_form.run()
-        if return_code == 1:
-            exit(1)
+    def send(self, message: str, channel: Channel or None = None) -> None:
+        """
+        Headless alternative to the chat UI's input. Queues a message for sending.
+
+        :param message: message to send
+        :param channel: channel to send the message to, the main channel by default
+        """
+        self.__user.add_to_tx_message_buffer(message=message, channel=channel)
+
+    def receive(self, timeout: float or None = None, channel: Channel or None = None) -> list:
+        """
+        Headless alternative to the chat UI's log. Waits for received messages and returns all of them.
+
+        :param timeout: maximum time in seconds to wait, None waits forever
+        :param channel: channel to receive the messages of, the main channel by default
+        :return: list of received ChatMessage records, empty if the timeout expired
+        """
+        try:
+            messages = [self.__user.get_rx_message(timeout, channel)]
+        except TimeoutError:
+            return []
+        return messages + self.__user.drain_rx_message_buffer(channel)
+
+    def close(self) -> None:
+        """
+        Closes the client's socket, which ends the messaging threads.
+        """
+        self.__closed = True
+
+        # wake up an authentication waiting for the connection
+        self.__connected.set()
+        try:
+            self.__client.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self.__client.close()
+
+        if self.__trace_recorder is not None:
+            self.__trace_recorder.close()
+
+    async def close_async(self) -> None:
+        """
+        Cancels the messaging coroutines and closes the connection's streams.
+        """
+        self.__closed = True
+        for task in self.__messaging_tasks:
+            task.cancel()
+        self.__messaging_tasks = []
+
+        if self.__writer is not None:
+            self.__writer.close()
+
+        if self.__trace_recorder is not None:
+            self.__trace_recorder.close()
+
+    def __open_connection(self) -> None:
+        """
+        Opens a new client socket to the server address with a single attempt.
+        """
+        self.__client = socket.create_connection(self.__server_address)
+        self.__configure_socket(self.__client)
 
-        # join the auth thread after authentication succeeded
-        auth_thread.join()
+        # frames of a previous connection can't be completed anymore
+        self.__decoder = FrameDecoder()
+        self.__pending_frames = []
+        self.__last_received = time.monotonic()
+        self.__connect_error = None
+        self.__connected.set()
 
-    def __connect(self, server_ip: str, server_port: int) -> None:
+    async def __open_connection_async(self) -> None:
         """
-        Connect to the server using the client's socket.
+        Opens new asyncio streams to the server address with a single attempt.
+        """
+        self.__loop = asyncio.get_running_loop()
+        self.__reader, self.__writer = await asyncio.open_connection(*self.__server_address)
+        self.__configure_socket(self.__writer.get_extra_info("socket"))
+
+        # frames of a previous connection can't be completed anymore
+        self.__decoder = FrameDecoder()
+        self.__pending_frames = []
+        self.__last_received = time.monotonic()
+        self.__connect_error = None
+        self.__connected.set()
+
+    def connect(self, server_ip: str, server_port: int) -> None:
+        """
+        Connect to the server using a new client socket, retrying with exponential backoff.
 
         :param server_ip: IP address of the target server
         :param server_port: Port of the target server
         """
-        connected = False
+        self.__server_address = (server_ip, server_port)
+        attempt = 0
 
-        # try to connect as long as  connection attempt fails
-        while not connected:
+        # try to connect as long as connection attempt fails
+        while True:
             try:
-                self.__client.connect((server_ip, server_port))
-                connected = True
-            except ConnectionRefusedError:
-                print("Connection refused, retrying...")
-                time.sleep(5)
+                self.__open_connection()
+                return
+            except OSError as error:
+                if self.__closed:
+                    raise
+                self.__connect_error = error
+                delay = self.__get_reconnect_delay(attempt)
+                attempt += 1
+                self.__on_connect_failed("connect_failures", "Connecting", error, delay)
+                time.sleep(delay)
+
+    async def connect_async(self, server_ip: str, server_port: int) -> None:
+        """
+        Open a connection to the server using asyncio streams, retrying with exponential backoff.
+
+        :param server_ip: IP address of the target server
+        :param server_port: Port of the target server
+        """
+        # the socket of the threaded mode isn't used
+        self.__client.close()
+
+        self.__server_address = (server_ip, server_port)
+        attempt = 0
+
+        # try to connect as long as connection attempt fails
+        while True:
+            try:
+                await self.__open_connection_async()
+                return
+            except OSError as error:
+                if self.__closed:
+                    raise
+                self.__connect_error = error
+                delay = self.__get_reconnect_delay(attempt)
+                attempt += 1
+                self.__on_connect_failed("connect_failures", "Connecting", error, delay)
+                await asyncio.sleep(delay)
+
+    def __connect_in_background(self, server_ip: str, server_port: int) -> None:
+        """
+        Connects to the server in a thread while the login form loads, giving up quietly once the client is closed.
+
+        :param server_ip: IP address of the target server
+        :param server_port: Port of the target server
+        """
+        try:
+            self.connect(server_ip, server_port)
+        except OSError:
+            # connect only gives up once the client has been closed, e.g. because the login form has been exited
+            pass
+
+    @staticmethod
+    def __warm_up() -> None:
+        """
+        Imports the modules which are only needed after the login, so they are loaded by the time they are used.
+        """
+        crypto.preload()
+        import tui.chat_ui  # noqa: F401
 
     def start(self, server_ip: str, server_port: int) -> None:
         """
@@ -268,11 +1414,44 @@ class Client:
         :param server_ip: IP address of the target server
         :param server_port: Port of the target server
         """
-        # connect to server
-        self.__connect(server_ip, server_port)
+        # connect to server and import the modules needed after the login in the background while the login form
+        # loads, the authentication waits for the connection
+        threading.Thread(target=self.__connect_in_background, args=(server_ip, server_port), daemon=True).start()
+        threading.Thread(target=self.__warm_up, daemon=True).start()
 
-        # initialize and start authentication thread and login form UI
+        # initialize and run the login form UI
         self.__init_authentication()
 
         # initialize and start messaging threads and chat UI
         self.__init_messaging()
+
+    async def start_async(self, server_ip: str, server_port: int) -> None:
+        """
+        Asyncio alternative to start. Connects to the server and runs the login form and the chat UI in the current
+        event loop, with authentication and messaging running as coroutines instead of threads.
+
+        :param server_ip: IP address of the target server
+        :param server_port: Port of the target server
+        """
+        # connect to server and import the modules needed after the login in the background while the login form
+        # loads, the authentication waits for the connection
+        self.__connect_task = asyncio.create_task(self.connect_async(server_ip, server_port))
+        warm_up_task = asyncio.create_task(asyncio.to_thread(self.__warm_up))
+
+        from tui.login_form import LoginTUI
+
+        # run login form, which awaits the authentication coroutine, exit program on keyboard interruption
+        login_form = LoginTUI(self.__user, authenticator=self.__authenticate_user_async)
+        return_code = await login_form.run_async()
+        if return_code == 1:
+            exit(1)
+
+        await warm_up_task
+
+        # run the messaging coroutines alongside the chat UI in the same event loop
+        self.start_messaging_async()
+        try:
+            chat_ui = self.__create_chat_ui()
+            await chat_ui.run_async()
+        finally:
+            await self.close_async()
@@ -0,0 +1,56 @@
+import zlib
+
+# zlib compression level, 6 is zlib's default trade-off between speed and size
+COMPRESSION_LEVEL: int = 6
+
+# raw deflate streams without zlib header and checksum, the ciphertext's HMAC already protects the message
+WINDOW_BITS: int = -15
+
+# upper bound for the size of a decompressed message, protects against decompression bombs
+MAX_DECOMPRESSED_SIZE: int = 1024 * 1024
+
+# preset dictionary of common chat text, primes the compressor so even short messages find matches.
+# Every client has to use the same dictionary, changing it breaks decompressing messages of older clients.
+# zlib prefers matches near the end of the dictionary, so the most common strings come last.
+PRESET_DICTIONARY: bytes = (
+    b"https://www.github.com/ .com/ .org/ http://  ```python ``` def class import return self. None True False "
+    b"Traceback (most recent call last): File line Error: exception error warning message server client "
+    b"tomorrow today tonight morning evening weekend meeting project school homework teacher lesson "
+    b"something anything everything nothing someone everyone because about would could should "
+    b"actually probably maybe really pretty think thought know don't doesn't didn't can't won't isn't "
+    b"I'm you're it's that's what's there's let's I'll I've I'd we're they're "
+    b"what when where which who why how does have has had been with this that there their they them "
+    b"thank you thanks please sorry okay yes no hello hey hi good great nice cool lol haha :) :D ;) "
+    b"the and for you are not but was can all one out get just like time now see "
+)
+
+
+def compress(data: bytes, level: int = COMPRESSION_LEVEL) -> bytes:
+    """
+    Compresses a message using the preset dictionary.
+
+    :param data: encoded message
+    :param level: zlib compression level from 1 (fastest) to 9 (smallest)
+    :return: raw deflate stream
+    """
+    compressor = zlib.compressobj(level, zlib.DEFLATED, WINDOW_BITS, zdict=PRESET_DICTIONARY)
+    return compressor.compress(data) + compressor.flush()
+
+
+def decompress(data: bytes or memoryview) -> bytes:
+    """
+    Decompresses a message compressed by compress.
+
+    :param data: raw deflate stream
+    :return: encoded message
+    :raises ValueError: if the data is corrupt, incomplete or decompresses to more than MAX_DECOMPRESSED_SIZE bytes
+    """
+    decompressor = zlib.decompressobj(WINDOW_BITS, zdict=PRESET_DICTIONARY)
+    try:
+        decompressed = decompressor.decompress(data, MAX_DECOMPRESSED_SIZE)
+    except zlib.error as error:
+        raise ValueError(f"Invalid compressed message: {error}") from error
+
+    if decompressor.unconsumed_tail or not decompressor.eof:
+        raise ValueError("Compressed message is incomplete or too large")
+    return decompressed
@@ -0,0 +1,2 @@
+# pytest puts the directory of this file, the repository root, on sys.path, so the tests import the client's modules
+# the same way main.py does
@@ -0,0 +1,332 @@
+import base64
+import binascii
+import hashlib
+import os
+import time
+from concurrent.futures import Executor
+
+import compression
+
+# minimum number of messages in a batch before it gets split across an executor's workers
+PARALLEL_THRESHOLD: int = 256
+
+# separates the key id tag from the Fernet token, which is URL-safe base64 and never contains a dot
+KEY_ID_SEPARATOR: bytes = b"."
+
+# separates the key id tag from the Fernet token of a message which has been compressed before encrypting it
+COMPRESSED_SEPARATOR: bytes = b":"
+
+# size of a key id in bytes before it gets base64 encoded
+KEY_ID_SIZE: int = 6
+
+# size of a key id tag in bytes, the base64 encoding of KEY_ID_SIZE bytes
+ENCODED_KEY_ID_SIZE: int = 8
+
+# key id of raw messages from older clients that don't tag their messages, they get decrypted anyway
+UNTAGGED_KEY_ID: bytes = bytes(KEY_ID_SIZE)
+
+# first byte of every Fernet token
+FERNET_VERSION: int = 0x80
+
+# raw Fernet token layout: version (1 byte), timestamp (8 bytes), IV (16 bytes), ciphertext, HMAC (32 bytes)
+IV_OFFSET: int = 9
+CIPHERTEXT_OFFSET: int = 25
+HMAC_SIZE: int = 32
+
+
+def preload() -> None:
+    """
+    Imports the cryptography package, which is otherwise only imported when the first cipher gets built.
+    Used to warm up the import in the background during startup.
+    """
+    import cryptography.fernet  # noqa: F401
+
+
+def get_key_id(key: bytes) -> bytes:
+    """
+    Derives a short, non-secret fingerprint of a key, used to tag messages encrypted with it.
+
+    :param key: encryption key
+    :return: 8 characters long URL-safe base64 key id
+    """
+    return base64.urlsafe_b64encode(get_raw_key_id(key))
+
+
+def get_raw_key_id(key: bytes) -> bytes:
+    """
+    Derives the fingerprint of a key as raw bytes, used by the binary wire format.
+
+    :param key: encryption key
+    :return: KEY_ID_SIZE bytes long key id
+    """
+    return hashlib.blake2s(key, digest_size=KEY_ID_SIZE, person=b"pytalkid").digest()
+
+
+def tag_raw_message(key_id: bytes, token: bytes, compressed: bool) -> bytes:
+    """
+    Converts a raw message to the tagged base64 form of the JSON wire format.
+
+    :param key_id: raw id of the key the message has been encrypted with
+    :param token: raw Fernet token
+    :param compressed: whether the message has been compressed before encrypting it
+    :return: message tagged with the base64 key id
+    """
+    separator = COMPRESSED_SEPARATOR if compressed else KEY_ID_SEPARATOR
+    return base64.urlsafe_b64encode(key_id) + separator + base64.urlsafe_b64encode(token)
+
+
+def get_message_key_id(encrypted_message: bytes) -> bytes:
+    """
+    Gets the raw id of the key a tagged message has been encrypted with.
+
+    :param encrypted_message: message tagged with the base64 key id
+    :return: raw key id, UNTAGGED_KEY_ID for untagged messages of older clients
+    """
+    separator = encrypted_message[ENCODED_KEY_ID_SIZE:ENCODED_KEY_ID_SIZE + 1]
+    if separator != KEY_ID_SEPARATOR and separator != COMPRESSED_SEPARATOR:
+        return UNTAGGED_KEY_ID
+    try:
+        return base64.urlsafe_b64decode(encrypted_message[:ENCODED_KEY_ID_SIZE])
+    except binascii.Error:
+        return UNTAGGED_KEY_ID
+
+
+class MessageCipher:
+    """
+    Fernet cipher built once per key, encrypting and decrypting single messages or whole batches.
+
+    Encrypted messages are tagged with the key id, so messages encrypted with other keys get skipped by comparing the
+    tag instead of failing the decryption.
+
+    Messages at least as long as the optional compression threshold are compressed before encrypting them, if that
+    makes them smaller. Compressed messages are tagged with a different separator, or flagged by the frame in the
+    binary wire format, and are always decompressed regardless of the own threshold.
+
+    Raw messages are Fernet tokens without the base64 encoding, sent by the binary wire format along with the raw key
+    id. They're en- and decrypted directly with AES-CBC and HMAC-SHA256 as specified by Fernet, so received
+    ciphertext is processed without being copied or encoded first.
+    """
+
+    def __init__(self, key: bytes, compression_threshold: int or None = None) -> None:
+        """
+        Initialize the cipher with the supplied key.
+
+        :param key: URL-safe base64 encoded 32 byte key
+        :param compression_threshold: minimum size in bytes of an encoded message to compress it, None to disable
+        """
+        # import cryptography on first use, it's one of the slowest imports of the client
+        from cryptography.exceptions import InvalidSignature
+        from cryptography.fernet import Fernet, InvalidToken
+        from cryptography.hazmat.primitives import hashes, hmac, padding
+        from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+
+        self.__key = key
+        self.__key_id = get_key_id(key)
+        self.__raw_key_id = get_raw_key_id(key)
+        self.__tag = self.__key_id + KEY_ID_SEPARATOR
+        self.__compressed_tag = self.__key_id + COMPRESSED_SEPARATOR
+        self.__compression_threshold = compression_threshold
+        self.__fernet = Fernet(key)
+        self.__invalid_token = InvalidToken
+
+        # primitives of raw messages, the first half of a Fernet key signs and the second half encrypts
+        fernet_key = base64.urlsafe_b64decode(key)
+        self.__signing_key = fernet_key[:16]
+        self.__aes = algorithms.AES(fernet_key[16:])
+        self.__sha256 = hashes.SHA256()
+        self.__pkcs7 = padding.PKCS7(128)
+        self.__hmac = hmac.HMAC
+        self.__cipher = Cipher
+        self.__cbc = modes.CBC
+        self.__invalid_signature = InvalidSignature
+
+    def get_key(self) -> bytes:
+        """Get the key the cipher has been built with."""
+        return self.__key
+
+    def get_key_id(self) -> bytes:
+        """Get the fingerprint of the key the cipher has been built with."""
+        return self.__key_id
+
+    def get_raw_key_id(self) -> bytes:
+        """Get the fingerprint of the key the cipher has been built with as raw bytes."""
+        return self.__raw_key_id
+
+    def get_compression_threshold(self) -> int or None:
+        """Get the minimum size of messages to compress, None if compression is disabled."""
+        return self.__compression_threshold
+
+    def __pack(self, message: str) -> tuple:
+        """
+        Encodes a message and compresses it if it reaches the compression threshold and compressing pays off.
+
+        :param message: message string
+        :return: tuple of whether the message has been compressed and the plaintext to encrypt
+        """
+        data = message.encode()
+        threshold = self.__compression_threshold
+        if threshold is not None and len(data) >= threshold:
+            compressed = compression.compress(data)
+            if len(compressed) < len(data):
+                return True, compressed
+        return False, data
+
+    @staticmethod
+    def __unpack(data: bytes, compressed: bool) -> str or None:
+        """
+        Decompresses a decrypted plaintext if needed and decodes it.
+
+        :param data: decrypted plaintext
+        :param compressed: whether the message has been compressed before encrypting it
+        :return: message string or None if it couldn't be decompressed or decoded
+        """
+        try:
+            return (compression.decompress(data) if compressed else data).decode()
+        except ValueError:
+            return None
+
+    def encrypt(self, message: str) -> bytes:
+        """
+        Encrypts a string.
+
+        :param message: message string to encrypt
+        :return: encrypted message tagged with the key id
+        """
+        compressed, data = self.__pack(message)
+        return (self.__compressed_tag if compressed else self.__tag) + self.__fernet.encrypt(data)
+
+    def decrypt(self, encrypted_message: bytes) -> str or None:
+        """
+        Decrypts a message in bytes.
+
+        :param encrypted_message: message in bytes to decrypt
+        :return: decrypted message or None if message couldn't be decrypted
+        """
+        # messages tagged with another key id can't be decrypted, untagged messages of older clients are tried
+        compressed = False
+        if encrypted_message.startswith(self.__tag):
+            encrypted_message = encrypted_message[len(self.__tag):]
+        elif encrypted_message.startswith(self.__compressed_tag):
+            encrypted_message = encrypted_message[len(self.__compressed_tag):]
+            compressed = True
+        elif KEY_ID_SEPARATOR in encrypted_message or COMPRESSED_SEPARATOR in encrypted_message:
+            return None
+
+        try:
+            return self.__unpack(self.__fernet.decrypt(encrypted_message), compressed)
+        except self.__invalid_token:
+            return None
+
+    def encrypt_messages(self, messages: list) -> list:
+        """
+        Encrypts a batch of strings, e.g. a drained transmit buffer.
+
+        :param messages: list of message strings to encrypt
+        :return: list of encrypted messages tagged with the key id in the same order
+        """
+        encrypt = self.encrypt
+        return [encrypt(message) for message in messages]
+
+    def decrypt_messages(self, encrypted_messages: list, executor: Executor or None = None) -> list:
+        """
+        Decrypts a batch of messages, e.g. a received burst.
+
+        If an executor is supplied and the batch is large, it gets split into chunks which are decrypted by the
+        executor's workers.
+
+        :param encrypted_messages: list of messages in bytes to decrypt
+        :param executor: optional executor to spread large batches across
+        :return: list of decrypted messages in the same order, None for messages that couldn't be decrypted
+        """
+        if executor is None or len(encrypted_messages) < PARALLEL_THRESHOLD:
+            decrypt = self.decrypt
+            return [decrypt(encrypted_message) for encrypted_message in encrypted_messages]
+
+        chunks = [
+            encrypted_messages[i:i + PARALLEL_THRESHOLD]
+            for i in range(0, len(encrypted_messages), PARALLEL_THRESHOLD)
+        ]
+        decrypted_messages = []
+        for decrypted_chunk in executor.map(self.decrypt_messages, chunks):
+            decrypted_messages += decrypted_chunk
+        return decrypted_messages
+
+    def encrypt_raw(self, message: str) -> tuple:
+        """
+        Encrypts a string to a raw Fernet token, its URL-safe base64 encoding is a regular Fernet token.
+
+        :param message: message string to encrypt
+        :return: tuple of whether the message has been compressed and the raw Fernet token, not tagged with the key id
+        """
+        compressed, data = self.__pack(message)
+        padder = self.__pkcs7.padder()
+        padded = padder.update(data) + padder.finalize()
+
+        iv = os.urandom(16)
+        encryptor = self.__cipher(self.__aes, self.__cbc(iv)).encryptor()
+        token = bytes([FERNET_VERSION]) + int(time.time()).to_bytes(8, "big") + iv
+        token += encryptor.update(padded) + encryptor.finalize()
+
+        signature = self.__hmac(self.__signing_key, self.__sha256)
+        signature.update(token)
+        return compressed, token + signature.finalize()
+
+    def decrypt_raw(self, key_id: bytes, token: bytes or memoryview, compressed: bool = False) -> str or None:
+        """
+        Decrypts a raw Fernet token.
+
+        :param key_id: raw key id the message has been tagged with
+        :param token: raw Fernet token, a memoryview of the received frame avoids copying it
+        :param compressed: whether the message has been compressed before encrypting it
+        :return: decrypted message or None if message couldn't be decrypted
+        """
+        # messages tagged with another key id can't be decrypted, untagged messages of older clients are tried
+        if key_id != self.__raw_key_id and key_id != UNTAGGED_KEY_ID:
+            return None
+        if len(token) < CIPHERTEXT_OFFSET + HMAC_SIZE or token[0] != FERNET_VERSION:
+            return None
+
+        # verify the signature before decrypting anything
+        signature = self.__hmac(self.__signing_key, self.__sha256)
+        signature.update(token[:-HMAC_SIZE])
+        try:
+            signature.verify(bytes(token[-HMAC_SIZE:]))
+        except self.__invalid_signature:
+            return None
+
+        decryptor = self.__cipher(self.__aes, self.__cbc(bytes(token[IV_OFFSET:CIPHERTEXT_OFFSET]))).decryptor()
+        unpadder = self.__pkcs7.unpadder()
+        try:
+            padded = decryptor.update(token[CIPHERTEXT_OFFSET:-HMAC_SIZE]) + decryptor.finalize()
+            data = unpadder.update(padded) + unpadder.finalize()
+        except ValueError:
+            return None
+        return self.__unpack(data, compressed)
+
+    def encrypt_raw_messages(self, messages: list) -> list:
+        """
+        Encrypts a batch of strings to raw Fernet tokens.
+
+        :param messages: list of message strings to encrypt
+        :return: list of (compressed, raw Fernet token) tuples in the same order
+        """
+        encrypt_raw = self.encrypt_raw
+        return [encrypt_raw(message) for message in messages]
+
+    def decrypt_raw_messages(self, raw_messages: list, executor: Executor or None = None) -> list:
+        """
+        Decrypts a batch of raw Fernet tokens, spread across an executor's workers like decrypt_messages.
+
+        :param raw_messages: list of (key id, raw Fernet token, compressed) tuples to decrypt
+        :param executor: optional executor to spread large batches across
+        :return: list of decrypted messages in the same order, None for messages that couldn't be decrypted
+        """
+        if executor is None or len(raw_messages) < PARALLEL_THRESHOLD:
+            decrypt_raw = self.decrypt_raw
+            return [decrypt_raw(key_id, token, compressed) for key_id, token, compressed in raw_messages]
+
+        chunks = [raw_messages[i:i + PARALLEL_THRESHOLD] for i in range(0, len(raw_messages), PARALLEL_THRESHOLD)]
+        decrypted_messages = []
+        for decrypted_chunk in executor.map(self.decrypt_raw_messages, chunks):
+            decrypted_messages += decrypted_chunk
+        return decrypted_messages
@@ -0,0 +1,167 @@
+import sqlite3
+
+from channel import MAIN_CHANNEL_NAME
+from message import ChatMessage
+
+# columns of a message read from the history, see ChatHistory.__to_messages
+MESSAGE_COLUMNS: str = "id, ts, username, text, sequence"
+
+
+class ChatHistory:
+    """
+    Append-only chat history of a channel stored in an SQLite database.
+
+    Messages get ascending ids, so a window of the history can be paged through by id without keeping it in memory.
+    The histories of every channel share the database, identified by the channel's id like the sync state, so channels
+    with the same name but different keys don't share their history. Messages are stored as their fields and read as
+    ChatMessage records, they only get formatted when they are shown.
+    """
+
+    def __init__(self, path: str, channel_id: bytes, name: str = MAIN_CHANNEL_NAME) -> None:
+        """
+        Open or create the history database.
+
+        :param path: path of the database file, ":memory:" for a history that isn't persisted
+        :param channel_id: id of the channel whose messages are read and written
+        :param name: name of the channel, stored along with its messages as a label
+        """
+        self.__path = path
+        self.__channel = channel_id.hex()
+        self.__name = name
+        self.__connection = sqlite3.connect(path)
+        self.__connection.execute("PRAGMA journal_mode=WAL")
+        self.__connection.execute("PRAGMA synchronous=NORMAL")
+        self.__connection.execute(
+            "CREATE TABLE IF NOT EXISTS messages (id INTEGER PRIMARY KEY AUTOINCREMENT, ts REAL, "
+            f"channel TEXT NOT NULL DEFAULT '{MAIN_CHANNEL_NAME}', username TEXT, text TEXT, "
+            "sequence INTEGER NOT NULL DEFAULT 0, channel_name TEXT)"
+        )
+
+        # histories created before channels existed belong to the main channel
+        columns = [row[1] for row in self.__connection.execute("PRAGMA table_info(messages)")]
+        if "channel" not in columns:
+            self.__connection.execute(
+                f"ALTER TABLE messages ADD COLUMN channel TEXT NOT NULL DEFAULT '{MAIN_CHANNEL_NAME}'"
+            )
+
+        # histories created before messages were stored as records hold formatted "<username>: <text>" lines,
+        # split them into their fields once. The old line column is left in place, but no longer filled.
+        if "username" not in columns:
+            self.__connection.execute("ALTER TABLE messages ADD COLUMN username TEXT")
+            self.__connection.execute("ALTER TABLE messages ADD COLUMN text TEXT")
+            self.__connection.execute("ALTER TABLE messages ADD COLUMN sequence INTEGER NOT NULL DEFAULT 0")
+            self.__connection.execute(
+                "UPDATE messages SET username = substr(line, 1, instr(line, ': ') - 1), "
+                "text = substr(line, instr(line, ': ') + 2) WHERE instr(line, ': ') > 0"
+            )
+            self.__connection.execute("UPDATE messages SET username = '', text = line WHERE username IS NULL")
+
+        # histories created before channels were identified by their id store the channel's name instead, it's kept
+        # as the label. Their messages aren't shown anymore, it's unknown which key they have been encrypted with.
+        if "channel_name" not in columns:
+            self.__connection.execute("ALTER TABLE messages ADD COLUMN channel_name TEXT")
+            self.__connection.execute("UPDATE messages SET channel_name = channel")
+        self.__connection.execute("CREATE INDEX IF NOT EXISTS messages_channel ON messages (channel, id)")
+        self.__connection.commit()
+
+    def for_channel(self, channel_id: bytes, name: str) -> "ChatHistory":
+        """
+        Open the history of another channel stored in the same database.
+
+        :param channel_id: id of the channel
+        :param name: name of the channel
+        :return: history of the channel
+        """
+        return ChatHistory(self.__path, channel_id, name)
+
+    def append_messages(self, messages: list) -> int:
+        """
+        Append messages to the history in a single transaction.
+
+        :param messages: list of ChatMessage records to append
+        :return: id of the last appended message
+        """
+        channel = self.__channel
+        name = self.__name
+        rows = [
+            (message.get_timestamp(), channel, name, message.get_username(), message.get_text(), message.get_sequence())
+            for message in messages
+        ]
+        with self.__connection:
+            self.__connection.executemany(
+                "INSERT INTO messages (ts, channel, channel_name, username, text, sequence) VALUES (?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+        return self.get_last_id()
+
+    @staticmethod
+    def __to_messages(rows) -> list:
+        """Convert rows of id, timestamp, username, text and sequence number to (id, ChatMessage) tuples."""
+        return [
+            (message_id, ChatMessage(username or "", text or "", timestamp, sequence))
+            for message_id, timestamp, username, text, sequence in rows
+        ]
+
+    def get_last_id(self) -> int:
+        """Get the id of the newest message, 0 if the history is empty."""
+        rows = self.__connection.execute(
+            "SELECT COALESCE(MAX(id), 0) FROM messages WHERE channel = ?", (self.__channel,)
+        )
+        return rows.fetchone()[0]
+
+    def get_first_id(self) -> int:
+        """Get the id of the oldest message, 0 if the history is empty."""
+        rows = self.__connection.execute(
+            "SELECT COALESCE(MIN(id), 0) FROM messages WHERE channel = ?", (self.__channel,)
+        )
+        return rows.fetchone()[0]
+
+    def get_latest(self, limit: int) -> list:
+        """
+        Get the newest messages of the history.
+
+        :param limit: maximum number of messages
+        :return: list of (id, ChatMessage) tuples, oldest first
+        """
+        rows = self.__connection.execute(
+            f"SELECT {MESSAGE_COLUMNS} FROM messages WHERE channel = ? ORDER BY id DESC LIMIT ?",
+            (self.__channel, limit),
+        )
+        return self.__to_messages(rows.fetchall()[::-1])
+
+    def get_before(self, message_id: int, limit: int) -> list:
+        """
+        Get the messages preceding a message.
+
+        :param message_id: id of the message
+        :param limit: maximum number of messages
+        :return: list of (id, ChatMessage) tuples, oldest first
+        """
+        rows = self.__connection.execute(
+            f"SELECT {MESSAGE_COLUMNS} FROM messages WHERE channel = ? AND id < ? ORDER BY id DESC LIMIT ?",
+            (self.__channel, message_id, limit),
+        )
+        return self.__to_messages(rows.fetchall()[::-1])
+
+    def get_after(self, message_id: int, limit: int) -> list:
+        """
+        Get the messages following a message.
+
+        :param message_id: id of the message
+        :param limit: maximum number of messages
+        :return: list of (id, ChatMessage) tuples, oldest first
+        """
+        rows = self.__connection.execute(
+            f"SELECT {MESSAGE_COLUMNS} FROM messages WHERE channel = ? AND id > ? ORDER BY id LIMIT ?",
+            (self.__channel, message_id, limit),
+        )
+        return self.__to_messages(rows.fetchall())
+
+    def clear(self) -> None:
+        """Delete every message of the history."""
+        with self.__connection:
+            self.__connection.execute("DELETE FROM messages WHERE channel = ?", (self.__channel,))
+
+    def close(self) -> None:
+        """Close the database."""
+        self.__connection.close()
@@ -0,0 +1,184 @@
+import base64
+import hashlib
+import hmac
+import json
+import os
+import threading
+
+# key derivation functions turning a passphrase into a channel's encryption key
+KDF_SCRYPT: str = "scrypt"
+KDF_PBKDF2: str = "pbkdf2"
+
+# salt shared by every client. Everyone entering the same passphrase has to end up with the same key, so the salt
+# can't be random, it only keeps precomputed tables of other applications from being used against PyTalk keys.
+SHARED_SALT: bytes = b"PyTalk channel key v1"
+
+# default cost parameters, every client of a channel has to use the same ones.
+# scrypt with n=2**15 takes roughly 150 ms and 32 MiB of memory on a current desktop CPU.
+SCRYPT_N: int = 2 ** 15
+SCRYPT_R: int = 8
+SCRYPT_P: int = 1
+PBKDF2_ITERATIONS: int = 600_000
+
+# length of the derived keys in bytes, Fernet keys are 32 bytes
+KEY_SIZE: int = 32
+
+# length in bytes of the random secret the cache keys are computed with, created once per cache file
+CACHE_SECRET_SIZE: int = 32
+
+
+class KeyDerivation:
+    """
+    Derives encryption keys from user supplied passphrases with a deliberately slow key derivation function.
+
+    Derived keys are cached in memory for the session and optionally in a file only the user can read, so the
+    derivation only has to be paid once per passphrase and set of parameters instead of on every login or channel
+    join. Derived keys are cached under an HMAC of the passphrase with a random secret of the cache file, so the cache
+    can't be looked up with precomputed hashes. Note that the cache file holds the keys themselves, it's only as safe
+    as the user's account.
+    """
+
+    def __init__(
+        self,
+        algorithm: str = KDF_SCRYPT,
+        scrypt_n: int = SCRYPT_N,
+        scrypt_r: int = SCRYPT_R,
+        scrypt_p: int = SCRYPT_P,
+        pbkdf2_iterations: int = PBKDF2_ITERATIONS,
+        salt: bytes = SHARED_SALT,
+        cache_path: str or None = None,
+    ) -> None:
+        """
+        Initialize the key derivation.
+
+        :param algorithm: KDF_SCRYPT or KDF_PBKDF2
+        :param scrypt_n: scrypt's CPU and memory cost, a power of 2
+        :param scrypt_r: scrypt's block size
+        :param scrypt_p: scrypt's parallelization
+        :param pbkdf2_iterations: number of PBKDF2-HMAC-SHA256 iterations
+        :param salt: salt shared by every client of a channel
+        :param cache_path: path of the file derived keys are cached in, None only caches them in memory
+        :raises ValueError: if the algorithm isn't supported
+        """
+        if algorithm == KDF_SCRYPT:
+            self.__parameters = f"{KDF_SCRYPT}:{scrypt_n}:{scrypt_r}:{scrypt_p}"
+        elif algorithm == KDF_PBKDF2:
+            self.__parameters = f"{KDF_PBKDF2}:{pbkdf2_iterations}"
+        else:
+            raise ValueError(f"Unsupported key derivation function: {algorithm}")
+
+        self.__algorithm = algorithm
+        self.__scrypt_n = scrypt_n
+        self.__scrypt_r = scrypt_r
+        self.__scrypt_p = scrypt_p
+        self.__pbkdf2_iterations = pbkdf2_iterations
+        self.__salt = salt
+        self.__cache_path = cache_path
+
+        # derived keys by cache key, shared by every user object of the process using this key derivation, and the
+        # secret of the cache keys
+        self.__lock = threading.Lock()
+        self.__secret, self.__cache = self.__load_cache()
+
+    def get_parameters(self) -> str:
+        """Get the algorithm and cost parameters, e.g. "scrypt:32768:8:1"."""
+        return self.__parameters
+
+    def derive(self, passphrase: str) -> bytes:
+        """
+        Derive an encryption key from a passphrase, or get it from the cache.
+
+        :param passphrase: user supplied passphrase
+        :return: base64 encoded Fernet key
+        """
+        cache_key = self.__get_cache_key(passphrase)
+
+        # holding the lock while deriving keeps concurrent logins with the same passphrase from deriving it twice
+        with self.__lock:
+            key = self.__cache.get(cache_key)
+            if key is None:
+                key = base64.urlsafe_b64encode(self.__derive_raw(passphrase.encode("utf-8")))
+                self.__cache[cache_key] = key
+                self.__save_cache()
+        return key
+
+    def __derive_raw(self, passphrase: bytes) -> bytes:
+        """
+        Run the key derivation function.
+
+        :param passphrase: UTF-8 encoded passphrase
+        :return: raw derived key
+        """
+        if self.__algorithm == KDF_SCRYPT:
+            # scrypt needs 128 * n * r * p bytes, allow twice that for OpenSSL's bookkeeping
+            max_memory = 2 * 128 * self.__scrypt_n * self.__scrypt_r * self.__scrypt_p
+            return hashlib.scrypt(
+                passphrase,
+                salt=self.__salt,
+                n=self.__scrypt_n,
+                r=self.__scrypt_r,
+                p=self.__scrypt_p,
+                maxmem=max_memory,
+                dklen=KEY_SIZE,
+            )
+        return hashlib.pbkdf2_hmac("sha256", passphrase, self.__salt, self.__pbkdf2_iterations, KEY_SIZE)
+
+    def __get_cache_key(self, passphrase: str) -> str:
+        """
+        Get the key a derived key is cached under, covering the parameters and salt so changing them derives again.
+        It's keyed with the cache's secret, a plain hash would let the passphrases be guessed against the cache file
+        at the speed of the hash instead of the key derivation function.
+
+        :param passphrase: user supplied passphrase
+        :return: hex digest
+        """
+        return hmac.new(
+            self.__secret,
+            self.__parameters.encode("utf-8") + b"\0" + self.__salt + b"\0" + passphrase.encode("utf-8"),
+            hashlib.sha256,
+        ).hexdigest()
+
+    def __load_cache(self) -> dict:
+        """
+        Load the secret and the derived keys cached on disk. A new secret is created if there is no cache file, it
+        can't be read or it has been written by a version without secret, its keys get derived again then.
+
+        :return: tuple of the secret and a dict of derived keys by cache key
+        """
+        if self.__cache_path is None:
+            return os.urandom(CACHE_SECRET_SIZE), {}
+        try:
+            with open(self.__cache_path, "r", encoding="utf-8") as cache_file:
+                cached = json.load(cache_file)
+            secret = bytes.fromhex(cached["secret"])
+            keys = {cache_key: key.encode("ascii") for cache_key, key in cached["keys"].items()}
+        except (OSError, ValueError, KeyError, TypeError, AttributeError):
+            return os.urandom(CACHE_SECRET_SIZE), {}
+        return secret, keys
+
+    def __save_cache(self) -> None:
+        """
+        Write the secret and the derived keys to the cache file, readable and writable by the user only. The file is
+        replaced atomically, so a crash can't leave a truncated cache behind.
+        """
+        if self.__cache_path is None:
+            return
+
+        cached = {
+            "secret": self.__secret.hex(),
+            "keys": {cache_key: key.decode("ascii") for cache_key, key in self.__cache.items()},
+        }
+        temp_path = f"{self.__cache_path}.tmp"
+        try:
+            # create the file with restricted permissions right away, so the keys are never readable by others
+            file_descriptor = os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(file_descriptor, "w", encoding="utf-8") as cache_file:
+                json.dump(cached, cache_file)
+            os.replace(temp_path, self.__cache_path)
+        except OSError:
+            # the in-memory cache still works, the key gets derived again after a restart
+            pass
+
+
+# key derivation used by user objects which don't get their own, shared so every user of the process hits its cache
+DEFAULT_KEY_DERIVATION: KeyDerivation = KeyDerivation()
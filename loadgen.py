@@ -0,0 +1,212 @@
+import argparse
+import asyncio
+import json
+import random
+import time
+
+from client import Client
+from ring_buffer import BufferFullError
+from user import User
+
+HOST: str = "localhost"
+PORT: int = 55555
+
+# prefix of generated messages, followed by the send timestamp in nanoseconds
+MESSAGE_PREFIX: str = "loadgen:"
+
+# maximum number of connections being opened at the same time
+CONNECT_CONCURRENCY: int = 100
+
+
+def percentile(sorted_values: list, fraction: float) -> float:
+    """
+    Get a percentile of sorted values using the nearest rank method.
+
+    :param sorted_values: values sorted in ascending order
+    :param fraction: percentile as fraction, e.g. 0.99 for p99
+    :return: percentile value, 0.0 if there are no values
+    """
+    if not sorted_values:
+        return 0.0
+    rank = min(len(sorted_values) - 1, max(0, round(fraction * len(sorted_values)) - 1))
+    return sorted_values[rank]
+
+
+class SimulatedUser:
+    """
+    Headless client sending messages at a random rate and measuring the latency of received generated messages.
+    """
+
+    def __init__(self, name: str, room_key: str, rate: float, latencies: list) -> None:
+        """
+        Initialize the simulated user.
+
+        :param name: username to log in or register with
+        :param room_key: encryption passphrase, users sharing it can read each other's messages
+        :param rate: average number of messages sent per second
+        :param latencies: list the end-to-end latencies in seconds are appended to
+        """
+        self.__name = name
+        self.__room_key = room_key
+        self.__rate = rate
+        self.__latencies = latencies
+        self.__user = User(rx_buffer_size=65536)
+        self.__client = Client(user_obj=self.__user)
+        self.__sent: int = 0
+        self.__refused: int = 0
+
+    def get_sent(self) -> int:
+        """Get the number of messages sent by the user."""
+        return self.__sent
+
+    def get_refused(self) -> int:
+        """Get the number of messages the client refused because of backpressure."""
+        return self.__refused
+
+    async def connect(self, server_ip: str, server_port: int) -> None:
+        """
+        Connect to the server and log in, registering the user first if the login fails.
+
+        :param server_ip: IP address of the target server
+        :param server_port: Port of the target server
+        """
+        await self.__client.connect_async(server_ip, server_port)
+
+        password = f"{self.__name}-password"
+        if not await self.__client.login_async(self.__name, password, self.__room_key):
+            if not await self.__client.login_async(self.__name, password, self.__room_key, register=True):
+                raise RuntimeError(f"Could neither log in nor register {self.__name}")
+
+        self.__client.start_messaging_async()
+
+    async def send_messages(self, duration: float) -> None:
+        """
+        Send messages with exponentially distributed pauses for the given duration.
+
+        :param duration: time in seconds to send messages for
+        """
+        end = time.monotonic() + duration
+        while True:
+            await asyncio.sleep(random.expovariate(self.__rate))
+            if time.monotonic() >= end:
+                return
+            # a full tx buffer or paused sending refuses the message, count it instead of aborting the whole run
+            try:
+                self.__client.send(f"{MESSAGE_PREFIX}{time.perf_counter_ns()}")
+            except BufferFullError:
+                self.__refused += 1
+                continue
+            self.__sent += 1
+
+    async def receive_messages(self) -> None:
+        """
+        Wait for received messages and record the latency of generated ones until the task is cancelled.
+        """
+        received = asyncio.Event()
+        self.__user.set_rx_listener(received.set)
+
+        while True:
+            await received.wait()
+            received.clear()
+            now = time.perf_counter_ns()
+
+            for message in self.__user.drain_rx_message_buffer():
+                text = message.get_text()
+                if text.startswith(MESSAGE_PREFIX):
+                    self.__latencies.append((now - int(text[len(MESSAGE_PREFIX):])) / 1e9)
+
+    async def close(self) -> None:
+        """Close the user's connection."""
+        await self.__client.close_async()
+
+
+async def run_load(
+    server_ip: str, server_port: int, users: int, rate: float, duration: float, rooms: int, drain_time: float
+) -> dict:
+    """
+    Runs simulated users against a server and measures throughput and end-to-end latency.
+
+    :param server_ip: IP address of the target server
+    :param server_port: Port of the target server
+    :param users: number of simulated users
+    :param rate: average number of messages each user sends per second
+    :param duration: time in seconds the users send messages for
+    :param rooms: number of encryption keys the users are spread over
+    :param drain_time: time in seconds to wait for in-flight messages after sending stopped
+    :return: dict with the results
+    """
+    latencies = []
+    run_id = random.randrange(16 ** 4)
+    simulated_users = [
+        SimulatedUser(f"lg{run_id:04x}{i}", f"loadgen-room-{i % rooms}", rate, latencies) for i in range(users)
+    ]
+
+    # open the connections with limited concurrency to avoid overrunning the server's listen backlog
+    semaphore = asyncio.Semaphore(CONNECT_CONCURRENCY)
+
+    async def connect(simulated_user: SimulatedUser) -> None:
+        async with semaphore:
+            await simulated_user.connect(server_ip, server_port)
+
+    await asyncio.gather(*(connect(simulated_user) for simulated_user in simulated_users))
+
+    receivers = [asyncio.create_task(simulated_user.receive_messages()) for simulated_user in simulated_users]
+    start = time.monotonic()
+    await asyncio.gather(*(simulated_user.send_messages(duration) for simulated_user in simulated_users))
+    await asyncio.sleep(drain_time)
+    elapsed = time.monotonic() - start
+
+    for receiver in receivers:
+        receiver.cancel()
+    for simulated_user in simulated_users:
+        await simulated_user.close()
+
+    sent = sum(simulated_user.get_sent() for simulated_user in simulated_users)
+    refused = sum(simulated_user.get_refused() for simulated_user in simulated_users)
+    latencies.sort()
+    return {
+        "users": users,
+        "rooms": rooms,
+        "rate_per_user": rate,
+        "duration": duration,
+        "sent": sent,
+        "refused": refused,
+        "received": len(latencies),
+        "sent_per_second": sent / duration,
+        "received_per_second": len(latencies) / elapsed,
+        "latency_p50_ms": percentile(latencies, 0.50) * 1000,
+        "latency_p99_ms": percentile(latencies, 0.99) * 1000,
+        "latency_p999_ms": percentile(latencies, 0.999) * 1000,
+        "latency_max_ms": (latencies[-1] if latencies else 0.0) * 1000,
+    }
+
+
+def main() -> None:
+    """
+    Parses the command line arguments, runs the load and prints the results.
+    """
+    parser = argparse.ArgumentParser(description="Run simulated PyTalk users against a server.")
+    parser.add_argument("--host", default=HOST, help="IP address of the target server")
+    parser.add_argument("--port", type=int, default=PORT, help="port of the target server")
+    parser.add_argument("--users", type=int, default=100, help="number of simulated users")
+    parser.add_argument("--rate", type=float, default=1.0, help="messages per second sent by each user")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds to send messages for")
+    parser.add_argument("--rooms", type=int, default=1, help="number of encryption keys the users are spread over")
+    parser.add_argument("--drain-time", type=float, default=2.0, help="seconds to wait for in-flight messages")
+    parser.add_argument("--json", metavar="PATH", help="also write the results to a JSON file")
+    args = parser.parse_args()
+
+    results = asyncio.run(
+        run_load(args.host, args.port, args.users, args.rate, args.duration, args.rooms, args.drain_time)
+    )
+
+    for name, value in results.items():
+        print(f"{name:>20}: {value:.3f}" if isinstance(value, float) else f"{name:>20}: {value}")
+
+    if args.json:
+        with open(args.json, "w") as file:
+            json.dump(results, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,33 @@
+import asyncio
+
 from client import Client
+from kdf import KeyDerivation
 from user import User
 
 HOST: str = "localhost"
 PORT: int = 55555
 
+# run networking as coroutines in the UI's event loop, set to False to use the threaded fallback
+USE_ASYNCIO: bool = True
+
+# chat history database, only the newest lines of it are kept in memory
+HISTORY_PATH: str = "pytalk_history.db"
+
+# queue of messages which haven't been sent yet, kept across restarts
+OUTBOX_PATH: str = "pytalk_outbox.db"
+
+# file encryption keys derived from passphrases are cached in, readable by the user only, so they aren't derived again
+# on every start. Set to None to only cache them in memory, the file holds the keys themselves.
+KEY_CACHE_PATH: str or None = "pytalk_keys.json"
+
+# file every received frame gets recorded to for replaying the session with bench/replay.py, None disables recording
+TRACE_PATH: str or None = None
+
 
 if __name__ == "__main__":
-    user = User()
-    client = Client(user_obj=user)
-    client.start(server_ip=HOST, server_port=PORT)
+    user = User(key_derivation=KeyDerivation(cache_path=KEY_CACHE_PATH))
+    client = Client(user_obj=user, history_path=HISTORY_PATH, outbox_path=OUTBOX_PATH, trace_path=TRACE_PATH)
+    if USE_ASYNCIO:
+        asyncio.run(client.start_async(server_ip=HOST, server_port=PORT))
+    else:
+        client.start(server_ip=HOST, server_port=PORT)
@@ -0,0 +1,53 @@
+import sys
+import time
+
+
+class ChatMessage:
+    """
+    Chat message as received from or sent to a channel.
+
+    Messages are kept as records until they are shown, only the lines visible in the chat UI get formatted. Usernames
+    are interned, so every message of a user shares a single string.
+    """
+
+    __slots__ = ("__username", "__text", "__timestamp", "__sequence")
+
+    def __init__(self, username: str, text: str, timestamp: float or None = None, sequence: int = 0) -> None:
+        """
+        Initialize the message.
+
+        :param username: name of the sending user
+        :param text: decrypted text of the message
+        :param timestamp: time the message has been received or sent as seconds since the epoch, now by default
+        :param sequence: sequence number assigned by the server, 0 if it hasn't been numbered
+        """
+        self.__username = sys.intern(username)
+        self.__text = text
+        self.__timestamp = timestamp if timestamp is not None else time.time()
+        self.__sequence = sequence
+
+    def get_username(self) -> str:
+        """Get the name of the sending user."""
+        return self.__username
+
+    def get_text(self) -> str:
+        """Get the text of the message."""
+        return self.__text
+
+    def get_timestamp(self) -> float:
+        """Get the time the message has been received or sent as seconds since the epoch."""
+        return self.__timestamp
+
+    def get_sequence(self) -> int:
+        """Get the sequence number assigned by the server, 0 if it hasn't been numbered."""
+        return self.__sequence
+
+    def format(self) -> str:
+        """Format the message as a line of the chat log."""
+        return f"{self.__username}: {self.__text}"
+
+    def __str__(self) -> str:
+        return self.format()
+
+    def __repr__(self) -> str:
+        return f"ChatMessage({self.__username!r}, {self.__text!r}, sequence={self.__sequence})"
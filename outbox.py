@@ -0,0 +1,102 @@
+import sqlite3
+import threading
+
+
+class Outbox:
+    """
+    Durable queue of outgoing messages stored in an SQLite database.
+
+    Messages are added as soon as they are taken from the transmit buffer and only removed after they have been
+    written to the socket, so messages queued while the connection is down or the client crashed get sent later.
+    The number of queued messages is tracked in memory per user, so it can be checked after every send.
+
+    Messages are queued encrypted, as raw Fernet tokens along with the raw id of their channel's key, so they can be
+    sent in either wire format without knowing the key and no plaintext is stored on disk. Every message belongs to
+    the user who has written it and is only sent once that user is logged in again.
+    """
+
+    def __init__(self, path: str = ":memory:") -> None:
+        """
+        Open or create the outbox database.
+
+        :param path: path of the database file, ":memory:" for an outbox that doesn't survive a restart
+        """
+        # the outbox is shared by the sending thread and the thread re-establishing the connection
+        self.__lock = threading.Lock()
+        self.__connection = sqlite3.connect(path, check_same_thread=False)
+        self.__connection.execute("PRAGMA journal_mode=WAL")
+        self.__connection.execute("PRAGMA synchronous=NORMAL")
+        self.__connection.execute(
+            "CREATE TABLE IF NOT EXISTS queued_messages "
+            "(id INTEGER PRIMARY KEY AUTOINCREMENT, username TEXT, channel BLOB, compressed INTEGER, token BLOB)"
+        )
+
+        # outboxes created before messages were tied to their user can't tell whose messages they hold, such
+        # messages are kept but never sent rather than being sent in the name of whoever logs in next
+        columns = [row[1] for row in self.__connection.execute("PRAGMA table_info(queued_messages)")]
+        if "username" not in columns:
+            self.__connection.execute("ALTER TABLE queued_messages ADD COLUMN username TEXT")
+        self.__connection.execute(
+            "CREATE INDEX IF NOT EXISTS queued_messages_username ON queued_messages (username, id)"
+        )
+        self.__connection.commit()
+
+        # number of queued messages by username
+        self.__lengths: dict = dict(
+            self.__connection.execute("SELECT username, COUNT(*) FROM queued_messages GROUP BY username")
+        )
+
+    def append(self, username: str, messages: list) -> None:
+        """
+        Add messages of a user to the outbox in a single transaction.
+
+        :param username: name of the user who has written the messages
+        :param messages: list of (channel id, compressed, raw Fernet token) tuples
+        """
+        with self.__lock, self.__connection:
+            self.__connection.executemany(
+                "INSERT INTO queued_messages (username, channel, compressed, token) VALUES (?, ?, ?, ?)",
+                [(username, *message) for message in messages],
+            )
+            self.__lengths[username] = self.__lengths.get(username, 0) + len(messages)
+
+    def get_pending(self, username: str, limit: int) -> list:
+        """
+        Get the oldest messages of a user which haven't been sent yet.
+
+        :param username: name of the user who has written the messages
+        :param limit: maximum number of messages
+        :return: list of (id, channel id, compressed, raw Fernet token) tuples, oldest first
+        """
+        with self.__lock:
+            rows = self.__connection.execute(
+                "SELECT id, channel, compressed, token FROM queued_messages WHERE username = ? ORDER BY id LIMIT ?",
+                (username, limit),
+            )
+            return rows.fetchall()
+
+    def remove_up_to(self, username: str, message_id: int) -> None:
+        """
+        Remove sent messages of a user from the outbox.
+
+        :param username: name of the user who has written the messages
+        :param message_id: id of the newest sent message, every older message of the user is removed as well
+        """
+        with self.__lock, self.__connection:
+            deleted = self.__connection.execute(
+                "DELETE FROM queued_messages WHERE username = ? AND id <= ?", (username, message_id)
+            )
+            self.__lengths[username] = self.__lengths.get(username, 0) - deleted.rowcount
+
+    def get_length(self, username: str) -> int:
+        """Get the number of messages of a user which haven't been sent yet."""
+        return self.__lengths.get(username, 0)
+
+    def __len__(self) -> int:
+        """Get the number of messages which haven't been sent yet."""
+        return sum(self.__lengths.values())
+
+    def close(self) -> None:
+        """Close the database."""
+        with self.__lock:
+            self.__connection.close()
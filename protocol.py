@@ -0,0 +1,225 @@
+import struct
+
+from crypto import KEY_ID_SIZE
+
+# every frame on the wire is prefixed with its payload length as unsigned 32-bit big endian integer
+HEADER = struct.Struct("!I")
+
+# upper bound for a single frame's payload, protects against garbage length headers
+MAX_FRAME_SIZE: int = 16 * 1024 * 1024
+
+# size of a single recv call, large enough to drain a burst of messages in one syscall
+RECV_SIZE: int = 64 * 1024
+
+
+# wire formats of message frames in order of preference, negotiated during authentication
+FORMAT_BINARY: str = "binary"
+FORMAT_JSON: str = "json"
+SUPPORTED_FORMATS: tuple = (FORMAT_BINARY, FORMAT_JSON)
+
+# header of a binary message frame: frame type, flags, username length, raw key id and sequence number, followed by
+# the username and the raw ciphertext. Messages sent to the server leave the username empty and the sequence number 0,
+# the server fills them in when relaying them. Sequence numbers are assigned by the server in ascending order.
+MESSAGE_HEADER = struct.Struct(f"!BBB{KEY_ID_SIZE}sQ")
+
+# frame type of binary message frames
+MESSAGE_TYPE: int = 1
+
+# message flag: the message has been compressed before encrypting it
+FLAG_COMPRESSED: int = 0x01
+
+# heartbeat frame of the binary wire format: frame type and the sender's monotonic send time in nanoseconds.
+# The server echoes heartbeats back to their sender unchanged.
+HEARTBEAT = struct.Struct("!BQ")
+
+# frame type of heartbeat frames
+HEARTBEAT_TYPE: int = 2
+
+# sync request of the binary wire format: frame type, raw key id, sequence number of the newest message the client has
+# seen and the maximum number of messages to send. The server answers with the missed messages of the key, as message
+# frames, followed by a sync end. A limit of 0 only asks for the current sequence number.
+SYNC_REQUEST = struct.Struct(f"!B{KEY_ID_SIZE}sQH")
+
+# frame type of sync requests
+SYNC_REQUEST_TYPE: int = 3
+
+# end of a page of synced messages: frame type, raw key id, sequence number the client is up to date with
+# and whether further messages are left, which the client asks for with another sync request
+SYNC_END = struct.Struct(f"!B{KEY_ID_SIZE}sQ?")
+
+# frame type of sync ends
+SYNC_END_TYPE: int = 4
+
+
+class FrameError(Exception):
+    """Raised when the byte stream contains an invalid frame."""
+
+
+def encode_frame(payload: bytes) -> bytes:
+    """
+    Prefixes a payload with its length so the receiver can split the byte stream into messages.
+
+    :param payload: payload bytes to frame
+    :return: length-prefixed frame
+    """
+    if len(payload) > MAX_FRAME_SIZE:
+        raise FrameError(f"Frame of {len(payload)} bytes exceeds the maximum of {MAX_FRAME_SIZE} bytes")
+    return HEADER.pack(len(payload)) + payload
+
+
+def encode_message(
+    key_id: bytes, ciphertext: bytes, username: bytes = b"", flags: int = 0, sequence: int = 0
+) -> bytes:
+    """
+    Builds a framed binary message.
+
+    :param key_id: raw id of the key the message has been encrypted with
+    :param ciphertext: raw ciphertext of the message
+    :param username: UTF-8 encoded name of the sending user, empty when sending to the server
+    :param flags: message flags, e.g. FLAG_COMPRESSED
+    :param sequence: sequence number assigned by the server, 0 when sending to the server
+    :return: length-prefixed binary message frame
+    """
+    header = MESSAGE_HEADER.pack(MESSAGE_TYPE, flags, len(username), key_id, sequence)
+    return encode_frame(header + username + ciphertext)
+
+
+def decode_message(frame: bytes) -> tuple:
+    """
+    Splits a binary message frame's payload into its fields without copying the ciphertext.
+
+    :param frame: payload of a binary message frame
+    :return: tuple of username, raw key id, flags, sequence number and a memoryview of the ciphertext
+    """
+    if len(frame) < MESSAGE_HEADER.size:
+        raise FrameError(f"Message frame of {len(frame)} bytes is shorter than its header")
+
+    frame_type, flags, username_len, key_id, sequence = MESSAGE_HEADER.unpack_from(frame)
+    if frame_type != MESSAGE_TYPE:
+        raise FrameError(f"Frame of type {frame_type} isn't a message")
+
+    view = memoryview(frame)
+    username_end = MESSAGE_HEADER.size + username_len
+    return str(view[MESSAGE_HEADER.size:username_end], "utf-8"), key_id, flags, sequence, view[username_end:]
+
+
+def encode_heartbeat(timestamp: int) -> bytes:
+    """
+    Builds a framed heartbeat.
+
+    :param timestamp: monotonic send time in nanoseconds
+    :return: length-prefixed heartbeat frame
+    """
+    return encode_frame(HEARTBEAT.pack(HEARTBEAT_TYPE, timestamp))
+
+
+def decode_heartbeat(frame: bytes) -> int:
+    """
+    Gets the send time of a heartbeat frame's payload.
+
+    :param frame: payload of a heartbeat frame
+    :return: monotonic send time in nanoseconds
+    """
+    if len(frame) != HEARTBEAT.size:
+        raise FrameError(f"Heartbeat frame of {len(frame)} bytes instead of {HEARTBEAT.size} bytes")
+    return HEARTBEAT.unpack(frame)[1]
+
+
+def encode_sync_request(key_id: bytes, sequence: int, limit: int) -> bytes:
+    """
+    Builds a framed sync request.
+
+    :param key_id: raw id of the key whose messages are requested
+    :param sequence: sequence number of the newest message the client has seen
+    :param limit: maximum number of messages the server sends, 0 only asks for the current sequence number
+    :return: length-prefixed sync request frame
+    """
+    return encode_frame(SYNC_REQUEST.pack(SYNC_REQUEST_TYPE, key_id, sequence, limit))
+
+
+def decode_sync_request(frame: bytes) -> tuple:
+    """
+    Splits a sync request frame's payload into its fields.
+
+    :param frame: payload of a sync request frame
+    :return: tuple of raw key id, sequence number and limit
+    """
+    if len(frame) != SYNC_REQUEST.size:
+        raise FrameError(f"Sync request frame of {len(frame)} bytes instead of {SYNC_REQUEST.size} bytes")
+    return SYNC_REQUEST.unpack(frame)[1:]
+
+
+def encode_sync_end(key_id: bytes, sequence: int, more: bool) -> bytes:
+    """
+    Builds a framed sync end.
+
+    :param key_id: raw id of the key whose messages have been sent
+    :param sequence: sequence number the client is up to date with after the page
+    :param more: whether further messages are left
+    :return: length-prefixed sync end frame
+    """
+    return encode_frame(SYNC_END.pack(SYNC_END_TYPE, key_id, sequence, more))
+
+
+def decode_sync_end(frame: bytes) -> tuple:
+    """
+    Splits a sync end frame's payload into its fields.
+
+    :param frame: payload of a sync end frame
+    :return: tuple of raw key id, sequence number and whether further messages are left
+    """
+    if len(frame) != SYNC_END.size:
+        raise FrameError(f"Sync end frame of {len(frame)} bytes instead of {SYNC_END.size} bytes")
+    return SYNC_END.unpack(frame)[1:]
+
+
+class FrameDecoder:
+    """
+    Incremental decoder for length-prefixed frames.
+
+    Received bytes are appended to a reusable buffer, every complete frame is returned and partial frames are kept
+    until the rest of them arrives with a later call.
+    """
+
+    def __init__(self) -> None:
+        """Initialize the decoder with an empty receive buffer."""
+        self.__buffer: bytearray = bytearray()
+
+    def feed(self, data: bytes) -> list:
+        """
+        Adds received bytes to the buffer and extracts every complete frame.
+
+        :param data: bytes received from the socket
+        :return: list of complete frame payloads in the order they were received
+        """
+        buffer = self.__buffer
+        buffer += data
+
+        frames = []
+        offset = 0
+        buffer_len = len(buffer)
+        header_size = HEADER.size
+
+        # extract frames as long as there is at least a complete header in the buffer
+        while buffer_len - offset >= header_size:
+            (frame_len,) = HEADER.unpack_from(buffer, offset)
+            if frame_len > MAX_FRAME_SIZE:
+                raise FrameError(f"Frame of {frame_len} bytes exceeds the maximum of {MAX_FRAME_SIZE} bytes")
+
+            # stop if the frame's payload hasn't been received completely yet
+            frame_end = offset + header_size + frame_len
+            if frame_end > buffer_len:
+                break
+
+            frames.append(bytes(buffer[offset + header_size:frame_end]))
+            offset = frame_end
+
+        # drop consumed bytes, keeping a partial frame for the next call
+        if offset:
+            del buffer[:offset]
+
+        return frames
+
+    def pending(self) -> int:
+        """Get the number of buffered bytes that don't form a complete frame yet."""
+        return len(self.__buffer)
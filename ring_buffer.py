@@ -0,0 +1,110 @@
+import collections
+import enum
+import threading
+
+
+class OverflowPolicy(enum.Enum):
+    """Behaviour of a ring buffer when an item gets added while it is full."""
+
+    # wait until a consumer has made room
+    BLOCK = "block"
+    # overwrite the oldest item
+    DROP_OLDEST = "drop_oldest"
+    # refuse the item by raising BufferFullError, so the producer can slow down
+    BACKPRESSURE = "backpressure"
+
+
+class BufferFullError(Exception):
+    """Raised when an item is added to a full ring buffer using the backpressure policy."""
+
+
+class RingBuffer:
+    """
+    Bounded, thread-safe FIFO buffer with an atomic drain-all operation.
+
+    Producers and consumers only hold the lock for constant time deque operations (or a single drain), so neither
+    side can lose items the other side is handling.
+    """
+
+    def __init__(self, capacity: int, policy: OverflowPolicy = OverflowPolicy.BLOCK) -> None:
+        """
+        Initialize the ring buffer.
+
+        :param capacity: maximum number of items the buffer holds
+        :param policy: behaviour when an item is added while the buffer is full
+        """
+        if capacity < 1:
+            raise ValueError("Capacity of a ring buffer must be at least 1")
+
+        self.__capacity = capacity
+        self.__policy = policy
+        self.__items: collections.deque = collections.deque(maxlen=capacity)
+        self.__dropped: int = 0
+
+        lock = threading.Lock()
+        self.__lock = lock
+        self.__not_empty = threading.Condition(lock)
+        self.__not_full = threading.Condition(lock)
+
+    def put(self, item, timeout: float or None = None):
+        """
+        Add an item to the buffer, handling a full buffer according to the overflow policy.
+
+        :param item: item to add
+        :param timeout: maximum time in seconds to wait for room with the block policy, None waits forever
+        :return: the item overwritten by the drop oldest policy to make room, None if no item has been overwritten
+        """
+        dropped = None
+        with self.__lock:
+            if len(self.__items) >= self.__capacity:
+                if self.__policy is OverflowPolicy.BACKPRESSURE:
+                    raise BufferFullError(f"Buffer is full ({self.__capacity} items)")
+                if self.__policy is OverflowPolicy.BLOCK:
+                    if not self.__not_full.wait_for(lambda: len(self.__items) < self.__capacity, timeout):
+                        raise BufferFullError(f"Buffer is still full after {timeout} seconds")
+                else:
+                    # the deque's maxlen drops the oldest item on append
+                    dropped = self.__items[0]
+                    self.__dropped += 1
+
+            self.__items.append(item)
+            self.__not_empty.notify()
+        return dropped
+
+    def get(self, timeout: float or None = None):
+        """
+        Remove and get the oldest item, blocking until one is available.
+
+        :param timeout: maximum time in seconds to wait, None waits forever
+        :return: oldest item of the buffer
+        """
+        with self.__lock:
+            if not self.__not_empty.wait_for(lambda: self.__items, timeout):
+                raise TimeoutError(f"Buffer is still empty after {timeout} seconds")
+            item = self.__items.popleft()
+            self.__not_full.notify()
+            return item
+
+    def drain(self) -> list:
+        """
+        Remove and get every item of the buffer in a single atomic operation.
+
+        :return: list of items, oldest first
+        """
+        with self.__lock:
+            items = list(self.__items)
+            self.__items.clear()
+            self.__not_full.notify_all()
+            return items
+
+    def get_dropped(self) -> int:
+        """Get the number of items that have been overwritten by the drop oldest policy."""
+        return self.__dropped
+
+    def get_capacity(self) -> int:
+        """Get the maximum number of items the buffer holds."""
+        return self.__capacity
+
+    def __len__(self) -> int:
+        """Get the number of items currently in the buffer."""
+        return len(self.__items)
@@ -0,0 +1,88 @@
+import struct
+import threading
+import time
+
+from protocol import FORMAT_BINARY, FORMAT_JSON
+
+# first bytes of every trace file, the version changes with the format of the records
+TRACE_MAGIC: bytes = b"PYTALKTRACE1"
+
+# a trace consists of bursts, each being the frames received with a single receive call: time since the recording
+# started in nanoseconds, wire format and number of frames, followed by the length-prefixed frame payloads
+BURST_HEADER = struct.Struct("!QBI")
+FRAME_LENGTH = struct.Struct("!I")
+
+# wire formats by the code they are stored as
+TRACE_FORMATS: tuple = (FORMAT_JSON, FORMAT_BINARY)
+
+
+class TraceRecorder:
+    """
+    Records the raw frames received by a client to a compact binary trace file, so the receive path can be profiled
+    later by replaying real traffic, see bench/replay.py.
+
+    Frames are recorded as received, i.e. still encrypted, along with the time they have been received at.
+    """
+
+    def __init__(self, path: str) -> None:
+        """
+        Create the trace file, replacing an existing one.
+
+        :param path: path of the trace file
+        """
+        self.__lock = threading.Lock()
+        self.__file = open(path, "wb")
+        self.__file.write(TRACE_MAGIC)
+        self.__start: int = time.monotonic_ns()
+
+    def record(self, frames: list, wire_format: str) -> None:
+        """
+        Append a burst of received frames to the trace.
+
+        :param frames: list of frame payloads received with a single receive call
+        :param wire_format: wire format of the connection the frames have been received on
+        """
+        parts = [BURST_HEADER.pack(time.monotonic_ns() - self.__start, TRACE_FORMATS.index(wire_format), len(frames))]
+        for frame in frames:
+            parts.append(FRAME_LENGTH.pack(len(frame)))
+            parts.append(frame)
+
+        with self.__lock:
+            if not self.__file.closed:
+                self.__file.write(b"".join(parts))
+
+    def close(self) -> None:
+        """Flush and close the trace file."""
+        with self.__lock:
+            self.__file.close()
+
+
+def read_trace(path: str):
+    """
+    Read the bursts of a trace file.
+
+    :param path: path of the trace file
+    :return: generator of (nanoseconds since the recording started, wire format, list of frame payloads) tuples
+    :raises ValueError: if the file isn't a trace file
+    """
+    with open(path, "rb") as trace_file:
+        if trace_file.read(len(TRACE_MAGIC)) != TRACE_MAGIC:
+            raise ValueError(f"{path} isn't a PyTalk trace file")
+
+        while header := trace_file.read(BURST_HEADER.size):
+            # a recording that has been interrupted may end with an incomplete burst
+            if len(header) < BURST_HEADER.size:
+                return
+            timestamp, format_code, frame_count = BURST_HEADER.unpack(header)
+
+            frames = []
+            for _ in range(frame_count):
+                length = trace_file.read(FRAME_LENGTH.size)
+                if len(length) < FRAME_LENGTH.size:
+                    return
+                (frame_length,) = FRAME_LENGTH.unpack(length)
+                frame = trace_file.read(frame_length)
+                if len(frame) < frame_length:
+                    return
+                frames.append(frame)
+            yield timestamp, TRACE_FORMATS[format_code], frames
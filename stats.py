@@ -0,0 +1,220 @@
+import json
+import math
+import time
+from collections import deque
+
+# number of histogram buckets per doubling of the value, higher is more precise
+BUCKETS_PER_OCTAVE: int = 4
+
+# number of histogram buckets, covering 1 µs to roughly 70 minutes
+BUCKET_COUNT: int = 32 * BUCKETS_PER_OCTAVE + 1
+
+# number of recent samples kept by a rolling window
+WINDOW_SIZE: int = 100
+
+
+class Histogram:
+    """
+    Log-scale histogram of durations with constant memory and constant time recording.
+
+    Bucket 0 holds durations below 1 µs, bucket i > 0 holds durations from 2 ** ((i - 1) / BUCKETS_PER_OCTAVE) µs
+    to 2 ** (i / BUCKETS_PER_OCTAVE) µs, so percentiles are accurate to about 19 %.
+    """
+
+    def __init__(self) -> None:
+        """Initialize an empty histogram."""
+        self.__buckets: list = [0] * BUCKET_COUNT
+        self.__count: int = 0
+        self.__total: float = 0.0
+        self.__min: float = math.inf
+        self.__max: float = 0.0
+
+    def record(self, seconds: float, count: int = 1) -> None:
+        """
+        Record a duration.
+
+        :param seconds: duration in seconds
+        :param count: number of times the duration occurred, e.g. the size of a batch it's the average of
+        """
+        microseconds = seconds * 1e6
+        if microseconds < 1:
+            index = 0
+        else:
+            index = min(BUCKET_COUNT - 1, int(math.log2(microseconds) * BUCKETS_PER_OCTAVE) + 1)
+
+        self.__buckets[index] += count
+        self.__count += count
+        self.__total += seconds * count
+        if seconds < self.__min:
+            self.__min = seconds
+        if seconds > self.__max:
+            self.__max = seconds
+
+    def get_count(self) -> int:
+        """Get the number of recorded durations."""
+        return self.__count
+
+    def percentile(self, fraction: float) -> float:
+        """
+        Get an upper bound of a percentile.
+
+        :param fraction: percentile as fraction, e.g. 0.99 for p99
+        :return: percentile in seconds, 0.0 if nothing has been recorded
+        """
+        if not self.__count:
+            return 0.0
+
+        rank = fraction * self.__count
+        cumulative = 0
+        for index, bucket in enumerate(self.__buckets):
+            cumulative += bucket
+            if cumulative >= rank:
+                upper_bound = 2 ** (index / BUCKETS_PER_OCTAVE) / 1e6 if index else 1e-6
+                return min(upper_bound, self.__max)
+        return self.__max
+
+    def summary(self) -> dict:
+        """
+        Get the summary of the histogram.
+
+        :return: dict with count, mean, min, max and percentiles in seconds
+        """
+        return {
+            "count": self.__count,
+            "mean": self.__total / self.__count if self.__count else 0.0,
+            "min": self.__min if self.__count else 0.0,
+            "max": self.__max,
+            "p50": self.percentile(0.50),
+            "p90": self.percentile(0.90),
+            "p99": self.percentile(0.99),
+            "p999": self.percentile(0.999),
+        }
+
+    def get_buckets(self) -> list:
+        """Get a copy of the bucket counts."""
+        return list(self.__buckets)
+
+
+class RollingWindow:
+    """
+    The most recent samples of a value, e.g. round-trip times, summarized as min, average and p99.
+    """
+
+    def __init__(self, size: int = WINDOW_SIZE) -> None:
+        """
+        Initialize an empty window.
+
+        :param size: number of samples kept, older samples are dropped
+        """
+        self.__samples: deque = deque(maxlen=size)
+
+    def add(self, value: float) -> None:
+        """Add a sample, dropping the oldest one if the window is full."""
+        self.__samples.append(value)
+
+    def summary(self) -> dict:
+        """
+        Get the summary of the samples in the window.
+
+        :return: dict with count, min, avg and p99, 0.0 if there are no samples
+        """
+        samples = sorted(self.__samples)
+        if not samples:
+            return {"count": 0, "min": 0.0, "avg": 0.0, "p99": 0.0}
+        return {
+            "count": len(samples),
+            "min": samples[0],
+            "avg": sum(samples) / len(samples),
+            "p99": samples[min(len(samples) - 1, math.ceil(0.99 * len(samples)) - 1)],
+        }
+
+
+class Stats:
+    """
+    Counters and per-stage latency histograms of a client.
+
+    Recording isn't locked, so values recorded concurrently by several threads for the same counter or stage may
+    occasionally get lost. Each stage is recorded by a single thread in practice.
+    """
+
+    # stages a message passes, in order
+    STAGES: tuple = ("tx_queue_wait", "encrypt", "send", "decrypt", "rx_queue_wait", "render")
+
+    def __init__(self) -> None:
+        """Initialize the stats with zeroed counters and empty histograms."""
+        self.__started = time.time()
+        self.__counters: dict = {}
+        self.__histograms: dict = {stage: Histogram() for stage in self.STAGES}
+        self.__windows: dict = {}
+
+    def count(self, name: str, value: int = 1) -> None:
+        """
+        Increase a counter.
+
+        :param name: name of the counter
+        :param value: value to increase the counter by
+        """
+        self.__counters[name] = self.__counters.get(name, 0) + value
+
+    def record(self, stage: str, seconds: float, count: int = 1) -> None:
+        """
+        Record the duration of a stage.
+
+        :param stage: name of the stage, see STAGES
+        :param seconds: duration in seconds
+        :param count: number of messages the duration applies to
+        """
+        histogram = self.__histograms.get(stage)
+        if histogram is None:
+            histogram = self.__histograms[stage] = Histogram()
+        histogram.record(seconds, count)
+
+    def sample(self, name: str, value: float) -> None:
+        """
+        Add a sample to a rolling window.
+
+        :param name: name of the window
+        :param value: sampled value
+        """
+        window = self.__windows.get(name)
+        if window is None:
+            window = self.__windows[name] = RollingWindow()
+        window.add(value)
+
+    def get_window(self, name: str) -> RollingWindow:
+        """Get a rolling window."""
+        return self.__windows.setdefault(name, RollingWindow())
+
+    def get_counter(self, name: str) -> int:
+        """Get the value of a counter, 0 if it hasn't been increased yet."""
+        return self.__counters.get(name, 0)
+
+    def get_histogram(self, stage: str) -> Histogram:
+        """Get the histogram of a stage."""
+        return self.__histograms.setdefault(stage, Histogram())
+
+    def snapshot(self) -> dict:
+        """
+        Get the current counters and histogram summaries.
+
+        :return: dict with the uptime, counters, a summary per stage and a summary per rolling window
+        """
+        return {
+            "uptime": time.time() - self.__started,
+            "counters": dict(self.__counters),
+            "stages": {stage: histogram.summary() for stage, histogram in self.__histograms.items()},
+            "windows": {name: window.summary() for name, window in self.__windows.items()},
+        }
+
+    def export(self, path: str) -> None:
+        """
+        Write the snapshot including the raw histogram buckets to a JSON file.
+
+        :param path: path of the JSON file
+        """
+        data = self.snapshot()
+        data["started"] = self.__started
+        data["buckets_per_octave"] = BUCKETS_PER_OCTAVE
+        data["buckets"] = {stage: histogram.get_buckets() for stage, histogram in self.__histograms.items()}
+        with open(path, "w") as file:
+            json.dump(data, file, indent=2)
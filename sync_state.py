@@ -0,0 +1,75 @@
+import sqlite3
+import threading
+
+
+class SyncState:
+    """
+    Sequence number of the newest message seen per channel, stored in an SQLite database.
+
+    The server numbers the messages it relays in ascending order. After connecting, the client asks the server only
+    for the messages of each channel after the stored sequence number. Sequence numbers are cached in memory, so they
+    can be checked for every received burst without querying the database.
+    """
+
+    def __init__(self, path: str = ":memory:") -> None:
+        """
+        Open or create the sync state, usually stored in the chat history database.
+
+        :param path: path of the database file, ":memory:" for a sync state that doesn't survive a restart
+        """
+        # the sync state is shared by the receiving thread, the decryption worker and the thread logging in
+        self.__lock = threading.Lock()
+        self.__connection = sqlite3.connect(path, check_same_thread=False)
+        self.__connection.execute("PRAGMA journal_mode=WAL")
+        self.__connection.execute("PRAGMA synchronous=NORMAL")
+        self.__connection.execute(
+            "CREATE TABLE IF NOT EXISTS sync_state (channel BLOB PRIMARY KEY, last_sequence INTEGER NOT NULL)"
+        )
+        self.__connection.commit()
+        self.__last_sequences: dict = dict(self.__connection.execute("SELECT channel, last_sequence FROM sync_state"))
+
+    def get_last_sequence(self, channel_id: bytes) -> int or None:
+        """
+        Get the sequence number of the newest message seen in a channel.
+
+        :param channel_id: id of the channel
+        :return: sequence number, None if the channel has never been synced
+        """
+        return self.__last_sequences.get(channel_id)
+
+    def update(self, last_sequences: dict) -> None:
+        """
+        Store the sequence numbers of the newest messages seen in a single transaction, stored sequence numbers are
+        never lowered.
+
+        :param last_sequences: dict of sequence numbers by channel id
+        """
+        with self.__lock, self.__connection:
+            for channel_id, sequence in last_sequences.items():
+                self.__last_sequences[channel_id] = max(sequence, self.__last_sequences.get(channel_id, 0))
+            self.__connection.executemany(
+                "INSERT INTO sync_state (channel, last_sequence) VALUES (?, ?) "
+                "ON CONFLICT (channel) DO UPDATE SET last_sequence = MAX(last_sequence, excluded.last_sequence)",
+                list(last_sequences.items()),
+            )
+
+    def rewind(self, last_sequences: dict) -> None:
+        """
+        Move stored sequence numbers back in a single transaction, e.g. before a message which has been received but
+        dropped, so the next sync fetches it again. Stored sequence numbers are never raised.
+
+        :param last_sequences: dict of sequence numbers by channel id
+        """
+        with self.__lock, self.__connection:
+            for channel_id, sequence in last_sequences.items():
+                self.__last_sequences[channel_id] = min(sequence, self.__last_sequences.get(channel_id, sequence))
+            self.__connection.executemany(
+                "INSERT INTO sync_state (channel, last_sequence) VALUES (?, ?) "
+                "ON CONFLICT (channel) DO UPDATE SET last_sequence = MIN(last_sequence, excluded.last_sequence)",
+                list(last_sequences.items()),
+            )
+
+    def close(self) -> None:
+        """Close the database."""
+        with self.__lock:
+            self.__connection.close()
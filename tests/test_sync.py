@@ -0,0 +1,188 @@
+import time
+
+import pytest
+
+import client as client_module
+from bench.fake_server import FakeServer
+from client import SYNC_PAGE_SIZE, Client
+from ring_buffer import BufferFullError
+from sync_state import SyncState
+from user import User
+
+ROOM_KEY: str = "sync-test-room"
+
+
+@pytest.fixture
+def server():
+    """Loopback stand-in for PyTalk_Server, numbering the messages it relays."""
+    fake_server = FakeServer()
+    port = fake_server.start()
+    yield port
+    fake_server.stop()
+
+
+def connect(port: int, username: str, history_path=None, register: bool = False, user=None) -> Client:
+    """Connects a headless client to the fake server, logs it in and starts its messaging threads."""
+    user = user if user is not None else User(rx_buffer_size=100_000)
+    client = Client(user, history_path=history_path, heartbeat_interval=None)
+    client.connect("127.0.0.1", port)
+    assert client.login(username, "password", ROOM_KEY, register=register)
+    client.start_messaging()
+    return client
+
+
+def send_all(client: Client, texts: list) -> None:
+    """Sends messages, waiting whenever the tx buffer refuses them."""
+    for text in texts:
+        while True:
+            try:
+                client.send(text)
+                break
+            except BufferFullError:
+                time.sleep(0.01)
+
+
+def receive_messages(client: Client, count: int, timeout: float = 5.0) -> list:
+    """Receives ChatMessage records until count have arrived or nothing arrived within the timeout."""
+    messages = []
+    while len(messages) < count:
+        received = client.receive(timeout=timeout)
+        if not received:
+            break
+        messages += received
+    return messages
+
+
+def receive_texts(client: Client, count: int, timeout: float = 5.0) -> list:
+    """Receives the texts of messages until count have arrived or nothing arrived within the timeout."""
+    return [message.get_text() for message in receive_messages(client, count, timeout)]
+
+
+def wait_for_sync_state(history_path: str, sequence: int, timeout: float = 5.0) -> None:
+    """Waits until the reader has stored a sequence number of the room, which happens after handing messages over."""
+    user = User()
+    user.set_encr_key(ROOM_KEY)
+    channel_id = user.get_main_channel().get_id()
+
+    # the sync state caches the sequence numbers when it's opened, so it's opened again for every check
+    deadline = time.monotonic() + timeout
+    while True:
+        sync_state = SyncState(history_path)
+        last_sequence = sync_state.get_last_sequence(channel_id) or 0
+        sync_state.close()
+        if last_sequence >= sequence or time.monotonic() >= deadline:
+            break
+        time.sleep(0.01)
+    assert last_sequence >= sequence
+
+
+def go_offline(server: int, history_path: str) -> None:
+    """Logs in a user for the first time, so its sync state knows the current sequence number, then disconnects."""
+    reader = connect(server, "reader", history_path, register=True)
+    sender = connect(server, "sender", register=True)
+    send_all(sender, ["live"])
+    messages = receive_messages(reader, 1)
+    assert [message.get_text() for message in messages] == ["live"]
+    wait_for_sync_state(history_path, messages[0].get_sequence())
+    reader.close()
+    sender.close()
+
+
+def send_while_offline(server: int, texts: list) -> None:
+    """Sends messages while the reader is offline and waits until the server has relayed every one of them."""
+    sender = connect(server, "sender")
+    watcher = connect(server, "watcher", register=True)
+    send_all(sender, texts)
+    assert len(receive_texts(watcher, len(texts))) == len(texts)
+    sender.close()
+    watcher.close()
+
+
+def test_missed_messages_are_synced(server, tmp_path):
+    history_path = str(tmp_path / "history.db")
+    go_offline(server, history_path)
+    missed = [f"missed {i}" for i in range(10)]
+    send_while_offline(server, missed)
+
+    reader = connect(server, "reader", history_path)
+    assert receive_texts(reader, len(missed)) == missed
+    assert receive_texts(reader, 1, timeout=0.5) == []
+    reader.close()
+
+
+def test_sync_pages_past_page_size(server, tmp_path):
+    history_path = str(tmp_path / "history.db")
+    go_offline(server, history_path)
+    missed = [f"missed {i}" for i in range(2 * SYNC_PAGE_SIZE + 50)]
+    send_while_offline(server, missed)
+
+    reader = connect(server, "reader", history_path)
+    messages = receive_messages(reader, len(missed))
+    assert [message.get_text() for message in messages] == missed
+    wait_for_sync_state(history_path, messages[-1].get_sequence())
+    reader.close()
+
+    # nothing has been missed since, so the next login doesn't sync anything
+    reader = connect(server, "reader", history_path)
+    assert receive_texts(reader, 1, timeout=0.5) == []
+    reader.close()
+
+
+def test_sync_resumes_after_drop_mid_sync(server, tmp_path, monkeypatch):
+    history_path = str(tmp_path / "history.db")
+    go_offline(server, history_path)
+    missed = [f"missed {i}" for i in range(3 * SYNC_PAGE_SIZE)]
+    send_while_offline(server, missed)
+
+    # keep the client from asking for the second page, so the connection drops with the sync half done
+    requests = []
+    encode_sync_request = client_module.encode_sync_request
+
+    def first_request_only(channel_id: bytes, after: int, limit: int) -> bytes:
+        requests.append(after)
+        return encode_sync_request(channel_id, after, limit) if len(requests) == 1 else b""
+
+    monkeypatch.setattr(client_module, "encode_sync_request", first_request_only)
+    reader = connect(server, "reader", history_path)
+    first_page = receive_texts(reader, SYNC_PAGE_SIZE)
+    assert first_page == missed[:SYNC_PAGE_SIZE]
+
+    # the request for the second page is built once the first page has been handed to the channel
+    deadline = time.monotonic() + 5.0
+    while len(requests) < 2 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert requests[1] > requests[0]
+    wait_for_sync_state(history_path, requests[1])
+    reader.close()
+    monkeypatch.undo()
+
+    # the next connection picks up right after the first page
+    reader = connect(server, "reader", history_path)
+    assert receive_texts(reader, len(missed) - SYNC_PAGE_SIZE) == missed[SYNC_PAGE_SIZE:]
+    reader.close()
+
+
+def test_dropped_messages_are_synced_again(server, tmp_path):
+    history_path = str(tmp_path / "history.db")
+    go_offline(server, history_path)
+
+    # the reader doesn't take any message out of its rx buffer, which only keeps the newest ones
+    user = User(rx_buffer_size=5)
+    reader = connect(server, "reader", history_path, user=user)
+    flood = [f"flood {i}" for i in range(20)]
+    sender = connect(server, "sender")
+    send_all(sender, flood)
+
+    # wait until the reader has processed every message and the sync end answering its login
+    stats = user.get_stats()
+    deadline = time.monotonic() + 5.0
+    while stats.get_counter("frames_processed") < len(flood) + 1 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert user.get_rx_message_buffer().get_dropped() == len(flood) - 5
+    reader.close()
+    sender.close()
+
+    # the messages that have been dropped are fetched again, along with the ones after them
+    reader = connect(server, "reader", history_path)
+    assert receive_texts(reader, len(flood)) == flood
+    reader.close()
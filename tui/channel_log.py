@@ -0,0 +1,227 @@
+import re
+
+from rich.cells import cell_len
+from rich.text import Text
+from textual.cache import LRUCache
+from textual.geometry import Size
+from textual.scroll_view import ScrollView
+from textual.strip import Strip
+
+# control characters are replaced when rendering a message, they would break the line
+CONTROL_CHARACTERS = re.compile("[\u0000-\u001f]")
+
+
+class ChannelLog(ScrollView, can_focus=True):
+    """
+    Log of a single channel, shown in its own tab of the chat UI.
+
+    The log keeps the channel's ChatMessage records and only formats the messages of the lines it renders, so messages
+    that are never scrolled into view are never formatted.
+
+    If the channel has an on-disk history, only a window of it is kept in the log and older or newer messages are
+    loaded when the user scrolls through it.
+    """
+
+    DEFAULT_CSS = """
+    ChannelLog {
+        background: $surface;
+        color: $text;
+        overflow: scroll;
+    }
+    """
+
+    # number of messages loaded from the history at once when scrolling through it
+    HISTORY_PAGE_SIZE: int = 200
+
+    # number of rendered lines kept, so scrolling back and forth doesn't format the same messages again
+    RENDER_CACHE_SIZE: int = 1024
+
+    def __init__(self, channel, history=None, scrollback_lines: int = 1000, **kwargs) -> None:
+        """
+        Initialize the log.
+
+        :param channel: channel whose messages are shown
+        :param history: optional ChatHistory of the channel storing every message on disk
+        :param scrollback_lines: number of messages kept in the log when there is a history
+        """
+        ScrollView.__init__(self, **kwargs)
+
+        self.__channel = channel
+        self.__history = history
+        self.__scrollback_lines = scrollback_lines
+
+        # shown messages, oldest first, their ids in the history if there is one and the width of the longest line
+        self.__messages: list = []
+        self.__message_ids: list = []
+        self.__max_messages = scrollback_lines if history is not None else None
+        self.__width: int = 0
+        self.__render_cache: LRUCache = LRUCache(self.RENDER_CACHE_SIZE)
+
+        # id of the newest message shown in the log and whether it's the newest message of the history
+        self.__last_shown_id: int = 0
+        self.__at_latest: bool = True
+
+    def get_channel(self):
+        """Get the channel whose messages are shown."""
+        return self.__channel
+
+    def get_messages(self) -> list:
+        """Get the shown messages, oldest first."""
+        return self.__messages
+
+    def on_mount(self) -> None:
+        """
+        Textual method which gets executed when the log has been added to the UI.
+        """
+        # show the newest messages of the history and load further messages when the user scrolls through the log
+        if self.__history is not None:
+            rows = self.__history.get_latest(self.__scrollback_lines)
+            self.__write([message for _, message in rows], [message_id for message_id, _ in rows])
+            self.__last_shown_id = self.__history.get_last_id()
+            self.watch(self, "scroll_y", self.__on_scrolled, init=False)
+
+    def add_messages(self, messages: list) -> None:
+        """
+        Appends messages to the history and writes them to the log, unless the user is looking at older messages.
+
+        :param messages: list of ChatMessage records
+        """
+        if self.__history is None:
+            self.__write(messages)
+            return
+
+        # messages appended in a single transaction get consecutive ids
+        last_id = self.__history.append_messages(messages)
+        if self.__at_latest:
+            self.__write(messages, range(last_id - len(messages) + 1, last_id + 1))
+            self.__last_shown_id = last_id
+
+    def clear_history(self) -> None:
+        """
+        Clears the log and deletes the channel's history.
+        """
+        self.__clear()
+        if self.__history is not None:
+            self.__history.clear()
+        self.__at_latest = True
+
+    def notify_style_update(self) -> None:
+        """
+        Textual method which gets executed when the styles have changed, rendered lines have to be rendered again.
+        """
+        ScrollView.notify_style_update(self)
+        self.__render_cache.clear()
+
+    def render_line(self, y: int) -> Strip:
+        """
+        Textual method which renders a line of the widget, formatting the message shown in it.
+
+        :param y: line of the widget
+        :return: rendered line, cropped to the widget's width
+        """
+        scroll_x, scroll_y = self.scroll_offset
+        index = scroll_y + y
+        width = self.size.width
+        rich_style = self.rich_style
+        if index >= len(self.__messages):
+            return Strip.blank(width, rich_style)
+
+        message = self.__messages[index]
+        strip = self.__render_cache.get(message)
+        if strip is None:
+            line = CONTROL_CHARACTERS.sub("\ufffd", message.format().expandtabs())
+            text = Text(line, no_wrap=True)
+            text.stylize(rich_style)
+            strip = Strip(text.render(self.app.console), cell_len(line))
+            self.__render_cache[message] = strip
+
+        return strip.crop_extend(scroll_x, scroll_x + width, rich_style)
+
+    def __write(self, messages: list, message_ids=None, scroll_end: bool = True) -> None:
+        """
+        Appends messages to the log, dropping the oldest ones beyond the scrollback if there is a history.
+
+        :param messages: list of ChatMessage records
+        :param message_ids: ids of the messages in the history, None if there is no history
+        :param scroll_end: scroll to the newest message if the log has been scrolled to the end before
+        """
+        if not messages:
+            return
+        at_end = self.scroll_y >= self.max_scroll_y
+
+        # the width is calculated from the messages' fields, so they don't have to be formatted
+        widths = (cell_len(message.get_username()) + 2 + cell_len(message.get_text()) for message in messages)
+        self.__width = max(self.__width, *widths)
+        self.__messages.extend(messages)
+        if message_ids is not None:
+            self.__message_ids.extend(message_ids)
+        if self.__max_messages is not None and len(self.__messages) > self.__max_messages:
+            surplus = len(self.__messages) - self.__max_messages
+            del self.__messages[:surplus]
+            del self.__message_ids[:surplus]
+
+        self.virtual_size = Size(self.__width, len(self.__messages))
+        if scroll_end and at_end:
+            self.scroll_end(animate=False)
+        self.refresh()
+
+    def __clear(self) -> None:
+        """
+        Removes every message from the log.
+        """
+        self.__messages = []
+        self.__message_ids = []
+        self.__width = 0
+        self.__render_cache.clear()
+        self.virtual_size = Size(0, 0)
+        self.refresh()
+
+    def __on_scrolled(self, scroll_y: float) -> None:
+        """
+        Loads older messages from the history when the top of the log has been reached
+        and newer messages when the bottom has been reached while looking at older messages.
+        """
+        if scroll_y <= 0:
+            self.__load_older_messages()
+        elif not self.__at_latest and scroll_y >= self.max_scroll_y:
+            self.__load_newer_messages()
+
+    def __load_older_messages(self) -> None:
+        """
+        Puts a page of older messages from the history on top of the log, dropping the newest messages if necessary.
+        """
+        first_shown_id = self.__message_ids[0] if self.__message_ids else self.__last_shown_id + 1
+        rows = self.__history.get_before(first_shown_id, self.HISTORY_PAGE_SIZE)
+        if not rows:
+            return
+
+        messages = [message for _, message in rows] + self.__messages
+        message_ids = [message_id for message_id, _ in rows] + self.__message_ids
+
+        # keep the log at its maximum size by dropping the newest messages, they are loaded again when scrolling down
+        surplus = len(messages) - self.__scrollback_lines
+        if surplus > 0:
+            messages = messages[:-surplus]
+            message_ids = message_ids[:-surplus]
+            self.__last_shown_id = message_ids[-1]
+            self.__at_latest = False
+
+        # rewrite the log and keep the message the user was looking at in place
+        self.__clear()
+        self.__write(messages, message_ids, scroll_end=False)
+        self.scroll_to(y=len(rows), animate=False)
+
+    def __load_newer_messages(self) -> None:
+        """
+        Appends a page of newer messages from the history to the log, dropping the oldest messages.
+        """
+        rows = self.__history.get_after(self.__last_shown_id, self.HISTORY_PAGE_SIZE)
+        if rows:
+            shown = len(self.__messages)
+            self.__write([message for _, message in rows], [message_id for message_id, _ in rows], scroll_end=False)
+            self.__last_shown_id = rows[-1][0]
+
+            # keep the message the user was looking at in place
+            dropped = shown + len(rows) - len(self.__messages)
+            self.scroll_to(y=self.scroll_y - dropped, animate=False)
+        self.__at_latest = self.__last_shown_id >= self.__history.get_last_id()
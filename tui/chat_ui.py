@@ -1,27 +1,82 @@
 import asyncio
+import time
 
 from textual.app import App, ComposeResult
-from textual.widgets import Log, Input, Footer
+from textual.message import Message
+from textual.widgets import Input, Footer, Static, TabbedContent, TabPane
+
+from message import ChatMessage
+from ring_buffer import BufferFullError
+from tui.channel_log import ChannelLog
 
 
 class ChatTUI(App):
     # subclass of App from Textual
 
-    BINDINGS = [("ctrl+x", "clear_log", "Clear message history")]
+    BINDINGS = [
+        ("ctrl+x", "clear_log", "Clear message history"),
+        ("ctrl+t", "toggle_stats", "Toggle stats"),
+        ("ctrl+o", "export_stats", "Export stats"),
+        ("ctrl+n", "next_channel", "Next channel"),
+    ]
+    CSS_PATH = "chat_ui.tcss"
+
+    # time in seconds between updates of the stats panel while it's shown
+    STATS_INTERVAL: float = 1.0
+
+    # file the stats get exported to on ctrl+o
+    STATS_EXPORT_PATH: str = "pytalk_stats.json"
+
+    # time in seconds received messages are collected for before they are written to the log at once
+    RENDER_INTERVAL: float = 1 / 60
+
+    # input prefix of the command joining a further channel, followed by the channel's name and password
+    JOIN_COMMAND: str = "/join"
+
+    # name shown as the sender of the user's own messages
+    OWN_USERNAME: str = "you"
+
+    # maximum number of characters of a message typed or pasted into the input. Frames allow far larger messages, the
+    # limit only keeps a single message from flooding the logs, while pasted text gets long enough to be compressed.
+    MAX_MESSAGE_LENGTH: int = 4096
+
+    class MessagesReceived(Message):
+        """Posted by the network side when messages have been added to the rx message buffer."""
 
-    def __init__(self, user):
+    class ConnectionChanged(Message):
+        """Posted by the network side when the connection has been lost or re-established."""
+
+    def __init__(self, user, history=None, scrollback_lines: int = 1000):
         # copy everything of the superclass' constructor
         App.__init__(self)
 
         # utilize user parameter value as user object
         self.__user = user
 
+        # optional ChatHistory of the main channel storing every message on disk, the histories of further channels
+        # are stored in the same database. Only the newest scrollback_lines are kept in the logs then.
+        self.__history = history
+        self.__scrollback_lines = scrollback_lines
+
+        # log of every channel shown in a tab
+        self.__channel_logs: dict = {}
+
+        # snapshot of the stats from the previous stats panel update, used to calculate rates
+        self.__previous_snapshot: dict or None = None
+
+        # whether a MessagesReceived message has been posted and the log hasn't been updated since
+        self.__update_pending: bool = False
+
     def compose(self) -> ComposeResult:
         """
         Textual method which yields the widgets.
         """
-        yield Log(auto_scroll=True, id="chat-out")
-        yield Input(placeholder="Enter some text...", max_length=100)
+        # one tab per joined channel
+        with TabbedContent(id="channels"):
+            for channel in self.__user.get_channels():
+                yield self.__create_channel_pane(channel)
+        yield Static(id="stats")
+        yield Input(placeholder="Enter some text...", max_length=self.MAX_MESSAGE_LENGTH)
         yield Footer()
 
     def on_ready(self) -> None:
@@ -31,52 +86,225 @@ class ChatTUI(App):
         # put focus on the input widget
         self.query_one(Input).focus()
 
-        # create task to update the log in the background
-        asyncio.create_task(self.__update_log())
+        # update the stats panel periodically, the timer only runs while the panel is shown
+        self.__stats_timer = self.set_interval(self.STATS_INTERVAL, self.__update_stats, pause=True)
+
+        # get notified about received messages and show the ones that arrived while the UI was loading
+        self.__user.set_rx_listener(self.__notify_messages_received)
+        self.__update_log()
+
+        # get notified when the connection is lost or re-established, post_message is thread-safe
+        self.__user.set_connection_listener(lambda: self.post_message(self.ConnectionChanged()))
+
+    def on_unmount(self) -> None:
+        """
+        Textual method which gets executed when the UI is shut down.
+        """
+        self.__user.set_rx_listener(None)
+        self.__user.set_connection_listener(None)
+
+    def __create_channel_pane(self, channel) -> TabPane:
+        """
+        Creates the tab of a channel, showing the channel's log.
+
+        :param channel: channel to create the tab for
+        :return: tab pane containing the channel's log
+        """
+        history = None
+        if self.__history is not None:
+            is_main_channel = channel is self.__user.get_main_channel()
+            if is_main_channel:
+                history = self.__history
+            else:
+                history = self.__history.for_channel(channel.get_id(), channel.get_name())
+
+        channel_log = ChannelLog(channel, history, self.__scrollback_lines)
+        self.__channel_logs[channel] = channel_log
+        return TabPane(channel.get_name(), channel_log, id=f"channel-{len(self.__channel_logs)}")
+
+    def __get_active_log(self) -> ChannelLog:
+        """Get the log of the channel whose tab is active."""
+        active_pane = self.query_one(TabbedContent).active_pane
+        return active_pane.query_one(ChannelLog)
+
+    def __notify_messages_received(self) -> None:
+        """
+        Called by the network side for every received message, possibly from another thread.
+        Posts a single MessagesReceived message until the log has been updated.
+        """
+        if not self.__update_pending:
+            self.__update_pending = True
+            # post_message is thread-safe
+            self.post_message(self.MessagesReceived())
+
+    def on_chat_tui_messages_received(self) -> None:
+        """
+        Textual method which gets executed when a MessagesReceived message has been posted.
+        Collects the messages arriving within one frame and writes them to the log at once.
+        """
+        self.set_timer(self.RENDER_INTERVAL, self.__update_log)
+
+    def on_chat_tui_connection_changed(self) -> None:
+        """
+        Textual method which gets executed when a ConnectionChanged message has been posted.
+        Tells the user about the connection status, messages sent while offline are queued.
+        """
+        connection_error = self.__user.get_connection_error()
+        if connection_error is not None:
+            # the client has stopped reconnecting, keep the error shown
+            self.notify(connection_error, severity="error", timeout=float("inf"))
+        elif self.__user.get_connected():
+            self.notify("Connection re-established.")
+        else:
+            self.notify("Connection lost, reconnecting... Messages are sent once reconnected.", severity="warning")
 
     def on_input_submitted(self, event: Input.Submitted) -> None:
         """
         Textual method which gets executed when input from an input field is submitted by the user.
+        Sends the input to the channel of the active tab, unless it's a command.
         """
-        # write input contents to the log
-        self.query_one(Log).write_line("you: " + event.value)
+        if event.value.startswith(self.JOIN_COMMAND + " "):
+            self.__join_channel(event.value)
+            return
+
+        channel_log = self.__get_active_log()
+
+        # add input contents to the transmit message buffer, keep them in the input field if the buffer is full
+        try:
+            self.__user.add_to_tx_message_buffer(message=event.value, channel=channel_log.get_channel())
+        except BufferFullError:
+            self.notify("Too many messages are waiting to be sent, try again.", severity="warning")
+            return
 
-        # add input contents to the transmit message buffer
-        self.__user.add_to_tx_message_buffer(message=event.value)
+        # write input contents to the log
+        channel_log.add_messages([ChatMessage(self.OWN_USERNAME, event.value)])
 
         # clear the input field
         self.query_one(Input).clear()
 
+    def __join_channel(self, command: str) -> None:
+        """
+        Joins a further channel in a worker and opens a tab for it.
+
+        :param command: submitted join command, "/join <name> <password>"
+        """
+        arguments = command.split(maxsplit=2)
+        if len(arguments) != 3:
+            self.notify(f"Usage: {self.JOIN_COMMAND} <name> <password>", severity="error")
+            return
+
+        self.run_worker(self.__add_channel(name=arguments[1], key=arguments[2]), group="join")
+
+    async def __add_channel(self, name: str, key: str) -> None:
+        """
+        Derives the channel's key in a thread, joins the channel and opens its tab.
+
+        :param name: name of the channel
+        :param key: password of the channel
+        """
+        # deriving the key is deliberately slow unless it has been cached, the UI keeps running meanwhile
+        try:
+            channel = await asyncio.to_thread(self.__user.add_channel, name=name, key=key)
+        except ValueError as error:
+            self.notify(str(error), severity="error")
+            return
+
+        # open the channel's tab and switch to it
+        channel_pane = self.__create_channel_pane(channel)
+        tabbed_content = self.query_one(TabbedContent)
+        await tabbed_content.add_pane(channel_pane)
+        tabbed_content.active = channel_pane.id
+
+        self.query_one(Input).clear()
+
+    def action_next_channel(self) -> None:
+        """
+        Textual method which gets executed on ctrl+n, see BINDINGS. Switches to the tab of the next channel.
+        """
+        tabbed_content = self.query_one(TabbedContent)
+        pane_ids = [pane.id for pane in tabbed_content.query(TabPane)]
+        tabbed_content.active = pane_ids[(pane_ids.index(tabbed_content.active) + 1) % len(pane_ids)]
+
     def action_clear_log(self) -> None:
         """
-        Textual method which gets executed on ctrl+x, see BINDINGS. Clears the message history.
+        Textual method which gets executed on ctrl+x, see BINDINGS. Clears the message history of the active channel.
         """
-        self.query_one(Log).clear()
+        self.__get_active_log().clear_history()
 
-    async def __update_log(self) -> None:
+    def action_toggle_stats(self) -> None:
         """
-        Checks rx message buffer for new messages and updates the log accordingly.
+        Textual method which gets executed on ctrl+t, see BINDINGS. Shows or hides the stats panel.
         """
-        # get log widget as log_output
-        log_output = self.query_one(selector="#chat-out")
+        stats_panel = self.query_one(selector="#stats", expect_type=Static)
+        stats_panel.display = not stats_panel.display
 
-        # as long as the task is running
-        while True:
-            # get the received messages buffer
-            message_buffer = self.__user.get_rx_message_buffer()
+        if stats_panel.display:
+            self.__update_stats()
+            self.__stats_timer.resume()
+        else:
+            self.__stats_timer.pause()
 
-            # as long as the message buffer is empty, wait
-            while not message_buffer:
-                message_buffer = self.__user.get_rx_message_buffer()
-                # wait 100ms to avoid using up to many cpu cycles
-                await asyncio.sleep(0.1)
+    def action_export_stats(self) -> None:
+        """
+        Textual method which gets executed on ctrl+o, see BINDINGS. Exports the stats to a JSON file.
+        """
+        self.__user.get_stats().export(self.STATS_EXPORT_PATH)
+        self.notify(f"Stats exported to {self.STATS_EXPORT_PATH}")
 
-            # write contents of message buffer to the log
-            for message in message_buffer:
-                log_output.write_line(message)
+    def __update_stats(self) -> None:
+        """
+        Shows the current rates, counters, queue depths and stage latencies in the stats panel.
+        """
+        snapshot = self.__user.get_stats().snapshot()
+        counters = snapshot["counters"]
+
+        # calculate rates from the difference to the previous snapshot
+        previous = self.__previous_snapshot or {"uptime": 0.0, "counters": {}}
+        self.__previous_snapshot = snapshot
+        elapsed = (snapshot["uptime"] - previous["uptime"]) or 1.0
+
+        def rate(name: str) -> float:
+            return (counters.get(name, 0) - previous["counters"].get(name, 0)) / elapsed
+
+        rx_message_buffers = [channel.get_rx_message_buffer() for channel in self.__user.get_channels()]
+        tx_message_buffer = self.__user.get_tx_message_buffer()
+        lines = [
+            f"msg/s tx {rate('messages_sent'):.1f} rx {rate('messages_received'):.1f}  "
+            f"kB/s tx {rate('bytes_sent') / 1000:.1f} rx {rate('bytes_received') / 1000:.1f}  "
+            f"undecryptable {counters.get('messages_undecryptable', 0)}  "
+            f"queues tx {len(tx_message_buffer)}/{tx_message_buffer.get_capacity()} "
+            f"rx {sum(map(len, rx_message_buffers))}/{sum(buffer.get_capacity() for buffer in rx_message_buffers)} "
+            f"(dropped {sum(buffer.get_dropped() for buffer in rx_message_buffers)})",
+            f"failed attempts connect {counters.get('connect_failures', 0)} "
+            f"reconnect {counters.get('reconnect_failures', 0)}",
+        ]
+        rtt = snapshot["windows"].get("rtt")
+        if rtt and rtt["count"]:
+            lines.append(
+                f"rtt            min {rtt['min'] * 1000:8.3f} ms  avg {rtt['avg'] * 1000:8.3f} ms  "
+                f"p99 {rtt['p99'] * 1000:8.3f} ms  (last {rtt['count']} heartbeats)"
+            )
+        for stage, summary in snapshot["stages"].items():
+            lines.append(
+                f"{stage:<14} p50 {summary['p50'] * 1000:8.3f} ms  p99 {summary['p99'] * 1000:8.3f} ms  "
+                f"max {summary['max'] * 1000:8.3f} ms  n {summary['count']}"
+            )
+
+        self.query_one(selector="#stats", expect_type=Static).update("\n".join(lines))
+
+    def __update_log(self) -> None:
+        """
+        Writes every message of the channels' rx message buffers to their logs with a single write per channel.
+        """
+        # reset the flag before draining, so messages received meanwhile post a new notification
+        self.__update_pending = False
 
-            # clear the message buffer
-            self.__user.clear_rx_message_buffer()
+        for channel, channel_log in self.__channel_logs.items():
+            message_buffer = self.__user.drain_rx_message_buffer(channel)
 
-            # wait 100ms to avoid using up to many cpu cycles
-            await asyncio.sleep(0.1)
+            if message_buffer:
+                start = time.perf_counter()
+                channel_log.add_messages(message_buffer)
+                self.__user.get_stats().record(
+                    "render", (time.perf_counter() - start) / len(message_buffer), len(message_buffer)
+                )
@@ -1,21 +1,45 @@
-import time
+import asyncio
 
 from textual.app import App, ComposeResult
+from textual.message import Message
 from textual.widgets import Header, Footer, Tabs, Tab, Label, Input, Button
 
+from protocol import FrameError
+
 
 class LoginTUI(App):
 
     BINDINGS = [("ctrl+c", "exit", "Exit the program")]
     CSS_PATH = "login_form.tcss"
 
-    def __init__(self, user) -> None:
+    class AuthenticationCompleted(Message):
+        """Posted when the authenticator has returned the server's response."""
+
+        def __init__(self, operation: str, authed: bool, error: str or None = None) -> None:
+            """
+            :param operation: "register" or "login"
+            :param authed: whether the user has been authenticated
+            :param error: error message if the server couldn't be reached
+            """
+            super().__init__()
+            self.operation = operation
+            self.authed = authed
+            self.error = error
+
+    def __init__(self, user, authenticator) -> None:
         # copy everything from the superclass' constructor
         App.__init__(self)
 
         # utilize user parameter value as user object
         self.__user = user
 
+        # coroutine function authenticating the user with the credentials of the user object,
+        # returns whether the user has been authenticated
+        self.__authenticator = authenticator
+
+        # whether an authentication request is in progress
+        self.__authenticating: bool = False
+
     def compose(self) -> ComposeResult:
         """
         Textual method which yields the widgets.
@@ -64,38 +88,80 @@ class LoginTUI(App):
         # change window subtitle according to selected tab label
         self.sub_title = event.tab.label
 
-    def __check_user_credentials(self, operation: str) -> None:
+    def __check_user_credentials(self, operation: str, encr_key: str) -> None:
         """
-        Uses polling to communicate user credentials with the server class.
+        Starts the key derivation and the authentication in a worker, the UI stays responsive until the result arrives.
         :param operation: Set to "register" or "login"
+        :param encr_key: passphrase the encryption key gets derived from
         """
         # set the user's registration attribute according to operation parameter value
         self.__user.set_do_registration(operation == "register")
 
-        # set start_authentication to True, indicating the client class to start the auth process
-        self.__user.set_start_authentication(True)
+        # show the progress and prevent further submissions while waiting for the server
+        self.__set_authenticating(True)
+        self.query_one(Label).update("Authenticating...")
+
+        self.run_worker(self.__authenticate(operation, encr_key), exclusive=True)
 
-        # as long as the client class hasn't changed the start_authentication attribute, wait
-        while self.__user.get_start_authentication():
-            # wait 100ms to avoid using up to many cpu cycles
-            time.sleep(0.1)
+    async def __authenticate(self, operation: str, encr_key: str) -> None:
+        """
+        Derives the encryption key in a thread, awaits the authenticator coroutine and posts its result as
+        AuthenticationCompleted message.
+        :param operation: Set to "register" or "login"
+        :param encr_key: passphrase the encryption key gets derived from
+        """
+        # deriving the key is deliberately slow unless it has been cached
+        await asyncio.to_thread(self.__user.set_encr_key, encr_key)
+
+        try:
+            authed = await self.__authenticator()
+        except OSError as error:
+            self.post_message(self.AuthenticationCompleted(operation, False, error=f"Connection failed: {error}"))
+        except (FrameError, ValueError) as error:
+            # e.g. a feedback frame which isn't UTF-8 or a frame header the decoder rejects
+            self.post_message(self.AuthenticationCompleted(operation, False, error=f"Invalid server response: {error}"))
+        else:
+            self.post_message(self.AuthenticationCompleted(operation, authed))
+
+    def on_login_tui_authentication_completed(self, event: AuthenticationCompleted) -> None:
+        """
+        Textual method which gets executed when an AuthenticationCompleted message has been posted.
+        Exits the UI if the user has been authenticated or shows an error message if not.
+        :param event: AuthenticationCompleted message
+        """
+        self.__set_authenticating(False)
 
         # if user has got successfully authenticated, exit the UI
-        if self.__user.get_authed():
+        if event.authed:
             self.exit()
         # if not, show the respective error message
         else:
-            if operation == "login":
+            if event.error is not None:
+                feedback_message = event.error
+            elif event.operation == "login":
                 feedback_message = "Wrong credentials. Try again."
             else:
                 feedback_message = "Account already exists."
             self.query_one(Label).update(feedback_message)
 
+    def __set_authenticating(self, authenticating: bool) -> None:
+        """
+        Disables the inputs and the button while an authentication request is in progress.
+        :param authenticating: whether an authentication request is in progress
+        """
+        self.__authenticating = authenticating
+        for widget in self.query("Input, Button"):
+            widget.disabled = authenticating
+
     def __submit_user_credentials(self) -> None:
         """
         Submits user credentials that have been entered by the user and writes them to the user object.
         Initializes the authentication process communication with the client class.
         """
+        # ignore submissions while waiting for the server
+        if self.__authenticating:
+            return
+
         # get credentials from input fields
         user = self.query_one(selector="#username-input", expect_type=Input).value
         pw = self.query_one(selector="#password-input", expect_type=Input).value
@@ -108,13 +174,12 @@ class LoginTUI(App):
         # set user object attributes according to user input
         self.__user.set_username(username=user)
         self.__user.set_pw_hash(password=pw)
-        self.__user.set_encr_key(key=encr_key)
 
         # get the currently selected tab title, which is used to determine if the user chose to log in or to register
         selected_tab = self.sub_title
 
         # initiate user credential check
-        self.__check_user_credentials(operation=selected_tab)
+        self.__check_user_credentials(operation=selected_tab, encr_key=encr_key)
 
     def on_input_submitted(self) -> None:
         """
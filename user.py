@@ -1,19 +1,53 @@
-import base64
 import hashlib
+import time
+
+from channel import MAIN_CHANNEL_NAME, Channel
+from kdf import DEFAULT_KEY_DERIVATION, KeyDerivation
+from message import ChatMessage
+from ring_buffer import BufferFullError, OverflowPolicy, RingBuffer
+from stats import Stats
 
 
 class User:
 
-    def __init__(self) -> None:
-        """Initialize the user object."""
+    def __init__(
+        self,
+        rx_buffer_size: int = 4096,
+        tx_buffer_size: int = 1024,
+        rx_overflow_policy: OverflowPolicy = OverflowPolicy.DROP_OLDEST,
+        tx_overflow_policy: OverflowPolicy = OverflowPolicy.BACKPRESSURE,
+        key_derivation: KeyDerivation or None = None,
+    ) -> None:
+        """
+        Initialize the user object.
+
+        :param rx_buffer_size: maximum number of received messages per channel waiting to be displayed
+        :param tx_buffer_size: maximum number of submitted messages waiting to be sent
+        :param rx_overflow_policy: behaviour when a message is received while the receive buffer is full
+        :param tx_overflow_policy: behaviour when a message is submitted while the transmit buffer is full
+        :param key_derivation: derives the channels' encryption keys from passwords, by default a key derivation
+            with the default parameters shared by every user object of the process
+        """
         self.__username: str = ""
         self.__pw_hash: str = ""
         self.__do_registration: bool = False
-        self.__start_authentication: bool = False
         self.__authed: bool = False
-        self.__encr_key: bytes = b""
-        self.__rx_message_buffer: list = []
-        self.__tx_message_buffer: list = []
+        self.__connected: bool = False
+        self.__connection_error: str or None = None
+        self.__connection_listener = None
+        self.__rx_buffer_size = rx_buffer_size
+        self.__rx_overflow_policy = rx_overflow_policy
+        self.__key_derivation = key_derivation if key_derivation is not None else DEFAULT_KEY_DERIVATION
+
+        # channels by id, the main channel uses the encryption key entered in the login form
+        self.__main_channel: Channel = Channel(MAIN_CHANNEL_NAME, b"", rx_buffer_size, rx_overflow_policy)
+        self.__channels: dict = {self.__main_channel.get_id(): self.__main_channel}
+
+        self.__tx_message_buffer: RingBuffer = RingBuffer(tx_buffer_size, tx_overflow_policy)
+        self.__tx_paused: bool = False
+        self.__rx_listener = None
+        self.__tx_listener = None
+        self.__stats: Stats = Stats()
 
     def set_username(self, username: str) -> None:
         """Set the username."""
@@ -40,14 +74,6 @@ class User:
         """Get whether the user has requested to register"""
         return self.__do_registration
 
-    def set_start_authentication(self, status: bool) -> None:
-        """Set whether the user is authenticating."""
-        self.__start_authentication = status
-
-    def get_start_authentication(self) -> bool:
-        """Get whether the user is authenticating."""
-        return self.__start_authentication
-
     def set_authed(self, status: bool) -> None:
         """Set whether the user has been authenticated."""
         self.__authed = status
@@ -56,35 +82,149 @@ class User:
         """Get whether the user is authenticated."""
         return self.__authed
 
-    def set_encr_key(self, key: str) -> None:
-        """Set the encryption key with user supplied password."""
-        encoded_key = base64.b64encode(f"{key:<32}".encode("utf-8"))
-        self.__encr_key = encoded_key
+    def set_connected(self, status: bool) -> None:
+        """Set whether the client is connected and authenticated, notifying the UI."""
+        self.__connected = status
+        if self.__connection_listener is not None:
+            self.__connection_listener()
 
-    def get_encr_key(self) -> bytes:
-        """Get the encryption key."""
-        return self.__encr_key
+    def get_connected(self) -> bool:
+        """Get whether the client is connected and authenticated."""
+        return self.__connected
 
-    def add_to_rx_message_buffer(self, message: str) -> None:
-        """Add the message to the receive buffer."""
-        self.__rx_message_buffer.append(message)
+    def set_connection_error(self, error: str) -> None:
+        """Set why the client has given up reconnecting, notifying the UI."""
+        self.__connection_error = error
+        if self.__connection_listener is not None:
+            self.__connection_listener()
 
-    def clear_rx_message_buffer(self) -> None:
-        """Clear the receive buffer."""
-        self.__rx_message_buffer = []
+    def get_connection_error(self) -> str or None:
+        """Get why the client has given up reconnecting, None as long as it's connected or reconnecting."""
+        return self.__connection_error
 
-    def get_rx_message_buffer(self) -> list:
-        """Get the receive buffer."""
-        return self.__rx_message_buffer
+    def set_connection_listener(self, listener) -> None:
+        """Set a callable which gets called whenever the connection status or error has been set."""
+        self.__connection_listener = listener
 
-    def add_to_tx_message_buffer(self, message: str) -> None:
-        """Add the message to the transmit buffer."""
-        self.__tx_message_buffer.append(message)
+    def set_encr_key(self, key: str) -> None:
+        """Set the encryption key of the main channel with user supplied password."""
+        self.__main_channel.set_encr_key(self.__key_derivation.derive(key))
 
-    def clear_tx_message_buffer(self) -> None:
-        """Clear the transmit buffer."""
-        self.__tx_message_buffer = []
+        # the id of the main channel changes with its key
+        self.__channels = {channel.get_id(): channel for channel in self.__channels.values()}
 
-    def get_tx_message_buffer(self) -> list:
+    def get_encr_key(self) -> bytes:
+        """Get the encryption key of the main channel."""
+        return self.__main_channel.get_encr_key()
+
+    def add_channel(self, name: str, key: str) -> Channel:
+        """
+        Join a further channel, messages of it are received over the same connection.
+
+        :param name: name of the channel shown to the user
+        :param key: user supplied password of the channel
+        :return: the new channel
+        :raises ValueError: if a channel with the same name or password has already been joined
+        """
+        channel = Channel(name, self.__key_derivation.derive(key), self.__rx_buffer_size, self.__rx_overflow_policy)
+        if channel.get_id() in self.__channels:
+            raise ValueError("A channel with this password has already been joined")
+        if any(joined.get_name() == name for joined in self.__channels.values()):
+            raise ValueError(f"A channel named {name} has already been joined")
+
+        self.__channels[channel.get_id()] = channel
+        return channel
+
+    def get_channel(self, channel_id: bytes) -> Channel or None:
+        """Get a joined channel by its id, None if no channel with the id has been joined."""
+        return self.__channels.get(channel_id)
+
+    def get_channels(self) -> list:
+        """Get every joined channel, the main channel first."""
+        return list(self.__channels.values())
+
+    def get_main_channel(self) -> Channel:
+        """Get the channel using the encryption key entered in the login form."""
+        return self.__main_channel
+
+    def get_stats(self) -> Stats:
+        """Get the stats recorded by the client and the UI."""
+        return self.__stats
+
+    def __unwrap_messages(self, items: list, stage: str) -> list:
+        """Record how long the messages of (enqueue time, message) buffer items have been waiting and unwrap them."""
+        now = time.perf_counter()
+        record = self.__stats.record
+        messages = []
+        for enqueued, message in items:
+            record(stage, now - enqueued)
+            messages.append(message)
+        return messages
+
+    def add_to_rx_message_buffer(self, message: ChatMessage, channel: Channel or None = None) -> ChatMessage or None:
+        """
+        Add the message to the receive buffer of a channel (the main channel by default), notifying the UI.
+
+        :return: the oldest message of the buffer if it has been dropped to make room, None otherwise
+        """
+        dropped = (channel or self.__main_channel).get_rx_message_buffer().put((time.perf_counter(), message))
+        if self.__rx_listener is not None:
+            self.__rx_listener()
+        return dropped[1] if dropped is not None else None
+
+    def set_rx_listener(self, listener) -> None:
+        """Set a callable which gets called whenever a message has been added to the receive buffer of any channel."""
+        self.__rx_listener = listener
+
+    def get_rx_message(self, timeout: float or None = None, channel: Channel or None = None) -> ChatMessage:
+        """Get the next message of a channel, blocking until one is available or the timeout expired."""
+        rx_message_buffer = (channel or self.__main_channel).get_rx_message_buffer()
+        return self.__unwrap_messages([rx_message_buffer.get(timeout)], "rx_queue_wait")[0]
+
+    def drain_rx_message_buffer(self, channel: Channel or None = None) -> list:
+        """Remove and get every ChatMessage of a channel's receive buffer at once."""
+        rx_message_buffer = (channel or self.__main_channel).get_rx_message_buffer()
+        return self.__unwrap_messages(rx_message_buffer.drain(), "rx_queue_wait")
+
+    def get_rx_message_buffer(self, channel: Channel or None = None) -> RingBuffer:
+        """Get the receive buffer of a channel."""
+        return (channel or self.__main_channel).get_rx_message_buffer()
+
+    def add_to_tx_message_buffer(self, message: str, channel: Channel or None = None) -> None:
+        """
+        Add the message for a channel (the main channel by default) to the transmit buffer, waking up the sending
+        thread or coroutine.
+        Raises BufferFullError if the buffer is full and uses the backpressure policy, or if sending is paused.
+        """
+        if self.__tx_paused:
+            raise BufferFullError("Sending is paused until the queued messages have been sent")
+        self.__tx_message_buffer.put((time.perf_counter(), (channel or self.__main_channel, message)))
+        if self.__tx_listener is not None:
+            self.__tx_listener()
+
+    def set_tx_listener(self, listener) -> None:
+        """Set a callable which gets called whenever a message has been added to the transmit buffer."""
+        self.__tx_listener = listener
+
+    def set_tx_paused(self, status: bool) -> None:
+        """Set whether new messages are refused, set by the client while too many messages are waiting to be sent."""
+        self.__tx_paused = status
+
+    def get_tx_paused(self) -> bool:
+        """Get whether new messages are refused."""
+        return self.__tx_paused
+
+    def get_tx_message(self, timeout: float or None = None) -> tuple:
+        """
+        Get the next (channel, message) tuple from the transmit buffer, blocking until one is available or the timeout
+        expired.
+        """
+        return self.__unwrap_messages([self.__tx_message_buffer.get(timeout)], "tx_queue_wait")[0]
+
+    def drain_tx_message_buffer(self) -> list:
+        """Remove and get every (channel, message) tuple currently pending in the transmit buffer without blocking."""
+        return self.__unwrap_messages(self.__tx_message_buffer.drain(), "tx_queue_wait")
+
+    def get_tx_message_buffer(self) -> RingBuffer:
         """Get the transmit buffer."""
         return self.__tx_message_buffer